@@ -1,11 +1,26 @@
 # %%
-import numpy as np
-import pandas as pd
+import duckdb
 import matplotlib.pyplot as plt
 import seaborn as sns
 
+import lazy_frame
+from instrumentation import stage
+from quantile_sketch import grouped_quantile, grouped_sketches
+
+# %%
+# size of KLL quantile sketches for the medians, None for exact quantiles computed in the plan
+SKETCH_K = None
+# columns the figures read, other columns of the cleaned dataset are never loaded
+ANALYSIS_COLUMNS = [
+    "seniority_level", "seniority_level_num", "status", "industry", "country_code",
+    "company_size", "job_title", "salary", "salary_avg",
+]
+
 # %%
-df = pd.read_csv("./cleaned_data_science_job_posts_and_salaries_2025.csv")
+# plans only: nothing is read until the normalized frames are materialized below
+with stage("scan"):
+    con = duckdb.connect()
+    jobs = lazy_frame.scan(columns=ANALYSIS_COLUMNS, con=con)
 
 
 # %% [markdown]
@@ -13,57 +28,78 @@ df = pd.read_csv("./cleaned_data_science_job_posts_and_salaries_2025.csv")
 # How much do skills cost
 
 # %%
-# filter with IQR by country and normalize salary using Z score
-def iqr_filter(group):
-    if len(group) < 4:
-        return group
-    Q1 = group["salary_avg"].quantile(0.25)
-    Q3 = group["salary_avg"].quantile(0.75)
-    IQR = Q3 - Q1
-    filtered_group = group[(group["salary_avg"] >= Q1 - 1.5 * IQR) & (group["salary_avg"] <= Q3 + 1.5 * IQR)]
-    return filtered_group
+# filter with IQR by country and normalize salary using Z score,
+# both frames are computed once into tables every figure below reads its columns or groups from
+with stage("filter_and_normalize") as record:
+    df, df_unfiltered = lazy_frame.filter_and_normalize(jobs, "country_code")
+    df = lazy_frame.materialize(df, "filtered", con)
+    df_unfiltered = lazy_frame.materialize(df_unfiltered, "unfiltered", con)
+    record["rows_out"] = df.shape[0]
 
-def normalize_salary(group):
-    group["salary_avg_normalized"] = (group["salary_avg"] - group["salary_avg"].mean()) / group["salary_avg"].std()
-    return group
 
-df_unfiltered = df.copy()
-df = df.groupby("country_code").apply(iqr_filter).reset_index(drop=True)
-df = df.groupby("country_code").apply(normalize_salary).reset_index(drop=True)
-df_unfiltered = df_unfiltered.groupby("country_code").apply(normalize_salary).reset_index(drop=True)
+def job_counts(rel, by):
+    """
+    Number of postings with a salary of every group, in category order like groupby.
+    """
+    counts = lazy_frame.collect(lazy_frame.aggregate(rel, by, "count(salary) AS jobs"))
+    return counts.set_index(by)["jobs"].sort_index()
 
 # %%
 # Distribution is normal around 0 with thicker tail on right
-plt.hist(df["salary_avg_normalized"], bins=50, density=True)
-plt.show()
+with stage("plot_salary_histogram") as record:
+    salary = lazy_frame.collect(df, ["salary_avg_normalized"])
+    record["rows_in"] = len(salary)
+    plt.hist(salary["salary_avg_normalized"], bins=50, density=True)
+    plt.show()
 
 # %%
 # Boxplot of salary by seniority level
-df_unfiltered.boxplot(column="salary_avg_normalized", by="seniority_level_num")
-plt.show()
+with stage("plot_salary_by_seniority") as record:
+    by_seniority = lazy_frame.collect(df_unfiltered, ["salary_avg_normalized", "seniority_level_num"])
+    record["rows_in"] = len(by_seniority)
+    by_seniority.boxplot(column="salary_avg_normalized", by="seniority_level_num")
+    plt.show()
 
 # %%
 # Obviously everyone wants seniors
-df_unfiltered.groupby("seniority_level").salary.count().plot.bar()
-plt.show()
+with stage("plot_jobs_by_seniority"):
+    job_counts(df_unfiltered, "seniority_level").plot.bar()
+    plt.show()
 
 # %%
 # most variance is comming from small companies, large companies pay probably market salary (near 0 Z-score)
-df.plot.scatter(x="company_size", y="salary_avg_normalized")
-plt.show()
+with stage("plot_salary_by_company_size") as record:
+    by_size = lazy_frame.collect(df, ["company_size", "salary_avg_normalized"])
+    record["rows_in"] = len(by_size)
+    by_size.plot.scatter(x="company_size", y="salary_avg_normalized")
+    plt.show()
 
 # %%
 # retail pays more, education less
-df_unfiltered.groupby("industry").salary_avg_normalized.median().sort_values(ascending=False).plot(kind="bar")
-plt.show()
+with stage("plot_median_salary_by_industry"):
+    if SKETCH_K is None:
+        industry_median = lazy_frame.collect(
+            lazy_frame.aggregate(df_unfiltered, "industry", "median(salary_avg_normalized) AS median")
+        ).set_index("industry")["median"].sort_index()
+    else:
+        by_industry = lazy_frame.collect(df_unfiltered, ["industry", "salary_avg_normalized"])
+        industry_median = grouped_quantile(
+            grouped_sketches(by_industry, "industry", "salary_avg_normalized", SKETCH_K), 0.5, "industry"
+        )
+    industry_median.sort_values(ascending=False).plot(kind="bar")
+    plt.show()
 
 # %%
 # most common roles
 # hype bubble at its finest
-df_unfiltered.groupby("job_title").salary.count().sort_values(ascending=False).plot(kind="bar")
-plt.show()
+with stage("plot_jobs_by_title"):
+    job_counts(df_unfiltered, "job_title").sort_values(ascending=False).plot(kind="bar")
+    plt.show()
 
 # %%
 # remote jobs pay more
-df.boxplot(column="salary_avg_normalized", by="status")
-plt.show()
+with stage("plot_salary_by_status") as record:
+    by_status = lazy_frame.collect(df, ["status", "salary_avg_normalized"])
+    record["rows_in"] = len(by_status)
+    by_status.boxplot(column="salary_avg_normalized", by="status")
+    plt.show()
@@ -0,0 +1,258 @@
+# %%
+import argparse
+import ast
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import data_cleaning
+import salary_normalization
+import skill_index
+
+# %%
+BENCHMARK_ROWS = [10_000, 1_000_000, 10_000_000]
+RESULTS_DIR = "./benchmarks"
+# share of generated values not taken from the sample, they grow the number of distinct strings with size
+SYNTHETIC_SHARE = 0.2
+
+
+def format_money(amounts):
+    return "€" + pd.Series(amounts).round().astype(np.int64).map("{:,}".format)
+
+
+def format_scaled(amounts):
+    """
+    Amounts as raw revenue strings, e.g. €913.33M or €1.45T.
+    """
+    amounts = pd.Series(amounts)
+    exponent = np.clip(np.floor(np.log10(amounts) / 3), 2, 4).astype(int)
+    suffix = exponent.map({2: "M", 3: "B", 4: "T"})
+    return "€" + (amounts / 1000.0 ** exponent).map("{:.2f}".format) + suffix
+
+
+def synthetic_postings(rows, seed=0, sample_path=data_cleaning.INPUT_PATH):
+    """
+    Raw postings with the columns of the sample dataset.
+
+    Categorical columns and locations are drawn from the sample with its share of missing values,
+    salaries, company sizes, revenues, post dates and skill lists are generated
+    in the raw formats, e.g. "€118,736 - €237,469", "a month ago", "['python', 'sql']".
+    """
+    rng = np.random.default_rng(seed)
+    sample = next(data_cleaning.read_raw(sample_path))
+
+    def draw(column):
+        return rng.choice(sample[column].to_numpy(), rows)
+
+    def synthetic(share=SYNTHETIC_SHARE):
+        return rng.random(rows) < share
+
+    data = pd.DataFrame({
+        column: draw(column)
+        for column in ["job_title", "seniority_level", "status", "headquarter", "industry", "ownership"]
+    })
+    data.insert(3, "company", "company_" + pd.Series(rng.integers(0, max(1000, rows // 2), rows)).astype(str).str.zfill(3))
+
+    location = pd.Series(draw("location"))
+    states = np.array(sorted(state for state in data_cleaning.US_STATES if len(state) == 2))
+    towns = (
+        "Town " + pd.Series(rng.integers(0, max(100, rows // 100), rows)).astype(str)
+        + ", " + pd.Series(rng.choice(states, rows)).str.upper()
+        + pd.Series(rng.choice(["", " . Hybrid", " . Remote"], rows, p=[0.8, 0.1, 0.1]))
+    )
+    data.insert(4, "location", location.where(~synthetic(), towns))
+
+    units = rng.choice(["hours", "days", "months", "years"], rows, p=[0.02, 0.75, 0.2, 0.03])
+    count = np.select(
+        [units == "hours", units == "days", units == "months"],
+        [rng.integers(1, 24, rows), rng.integers(2, 31, rows), rng.integers(2, 12, rows)],
+        rng.integers(2, 5, rows),
+    )
+    phrases = pd.Series(count).astype(str) + " " + pd.Series(units) + " ago"
+    single = (rng.random(rows) < 0.2) & (units != "hours")
+    phrases = phrases.where(~single, "a " + pd.Series(units).str[:-1] + " ago")
+    data.insert(5, "post_date", pd.Series(draw("post_date")).where(~synthetic(0.5), phrases))
+
+    # a few company sizes hold revenue strings like in the raw data
+    size = pd.Series(rng.lognormal(7, 2.5, rows).clip(1, 2_000_000)).round().astype(np.int64).map("{:,}".format)
+    data["company_size"] = size.where(rng.random(rows) > 0.025, format_scaled(rng.lognormal(23, 2.5, rows)))
+    revenue = format_scaled(rng.lognormal(23, 2.5, rows))
+    data["revenue"] = revenue.where(
+        rng.random(rows) < 0.45, draw("revenue")
+    ).where(rng.random(rows) > 0.016)
+
+    low = rng.lognormal(11.6, 0.45, rows)
+    high = low * rng.uniform(1.05, 2.0, rows)
+    data["salary"] = format_money(low).where(
+        rng.random(rows) > 0.63, format_money(low) + " - " + format_money(high)
+    )
+
+    vocabulary = sorted(
+        {skill for skills in sample.skills.dropna() for skill in ast.literal_eval(skills)}
+        | set(data_cleaning.skill_mapping)
+    )
+    data["skills"] = synthetic_skills(rows, vocabulary, rng)
+    return data[sample.columns]
+
+
+def synthetic_skills(rows, vocabulary, rng, block=100_000):
+    """
+    Raw skill lists of distinct skills from vocabulary, 15% of them empty.
+    """
+    vocabulary = np.array(vocabulary, dtype=object)
+    sizes = np.where(rng.random(rows) < 0.15, 0, rng.poisson(6, rows).clip(1, len(vocabulary)))
+    skills = []
+    # a random permutation of the vocabulary per row, built a block of rows at a time
+    for start in range(0, rows, block):
+        order = np.argsort(rng.random((min(block, rows - start), len(vocabulary))), axis=1)
+        skills.extend(
+            repr(list(vocabulary[row[:size]]))
+            for row, size in zip(order, sizes[start:start + block])
+        )
+    return skills
+
+
+# %%
+def reset_peak_rss():
+    """
+    Reset peak resident set size of the process, returns False where it can't be reset.
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss():
+    """
+    Peak resident set size in bytes since reset_peak_rss, since process start where it couldn't reset.
+    """
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    # ru_maxrss is in kilobytes on linux and in bytes on macos
+    scale = 1 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+
+def measure(name, func, *args, **kwargs):
+    """
+    Run func, returns its result and a dict with stage name, wall time and peak RSS of the run.
+    """
+    reset_peak_rss()
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    seconds = time.perf_counter() - start
+    return result, {"stage": name, "seconds": seconds, "peak_rss_mb": peak_rss() / 2 ** 20}
+
+
+def benchmark(rows, seed=0):
+    """
+    Time every cleaning stage, writing the cleaned csv, normalization and skill prices
+    on synthetic_postings(rows, seed).
+    """
+    data = synthetic_postings(rows, seed)
+    stages = []
+    skill_ids = None
+    for name, stage in data_cleaning.cleaning_stages():
+        data, stats = measure(name, stage, data)
+        stages.append(stats)
+        # like data_cleaning.clean, the parsed skills aren't left in attrs pandas copies around
+        skill_ids = data.attrs.pop("skill_ids", skill_ids)
+    with tempfile.TemporaryDirectory() as tmp:
+        _, stats = measure("to_csv", data.to_csv, os.path.join(tmp, "cleaned.csv"), index=False)
+        stages.append(stats)
+    (df, _), stats = measure("filter_and_normalize", salary_normalization.filter_and_normalize, data)
+    stages.append(stats)
+    # the index is built from the ids merge_skills parsed, as in data_cleaning.write_cleaned
+    (matrix, vocabulary), stats = measure("build_skill_index", skill_index.skill_index_from_ids, *skill_ids)
+    stages.append(stats)
+    _, stats = measure(
+        "calculate_skill_prices", skill_index.calculate_skill_prices, df, use_normalized=True,
+        index=(matrix, np.array(list(vocabulary))),
+    )
+    stages.append(stats)
+    return {"rows": rows, "seed": seed, "stages": stages}
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "describe", "--always", "--dirty"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline):
+    """
+    Wall time of every stage against the baseline results file, ratio > 1 means slower.
+    """
+    def times(report):
+        return pd.DataFrame([
+            {"rows": run["rows"], "stage": stage["stage"], "seconds": stage["seconds"]}
+            for run in report["runs"] for stage in run["stages"]
+        ]).set_index(["rows", "stage"])["seconds"]
+
+    current, previous = times(results), times(baseline)
+    return pd.DataFrame({
+        "baseline": previous, "current": current, "ratio": current / previous,
+    }).dropna()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark cleaning and analysis stages on synthetic postings")
+    parser.add_argument(
+        "--rows", type=int, nargs="+", default=BENCHMARK_ROWS,
+        help="dataset sizes to benchmark, each is generated and run separately",
+    )
+    parser.add_argument("--seed", type=int, default=0, help="seed of the synthetic data generator")
+    parser.add_argument(
+        "--output", default=None,
+        help=f"results JSON file, {RESULTS_DIR}/<git revision>.json by default",
+    )
+    parser.add_argument("--compare", default=None, help="results JSON file of an earlier run to compare with")
+    return parser.parse_args(argv)
+
+# %%
+if __name__ == "__main__":
+    args = parse_args()
+    revision = git_revision()
+    results = {
+        "revision": revision,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "runs": [],
+    }
+    for rows in args.rows:
+        run = benchmark(rows, args.seed)
+        results["runs"].append(run)
+        print(f"\n{rows} rows")
+        print(pd.DataFrame(run["stages"]).to_string(index=False, float_format="{:.3f}".format))
+    output = args.output or os.path.join(RESULTS_DIR, f"{revision or 'results'}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {output}")
+    if args.compare:
+        with open(args.compare) as f:
+            print(compare(results, json.load(f)).to_string(float_format="{:.3f}".format))
@@ -0,0 +1,176 @@
+# %%
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import skill_index
+
+# %%
+CLEANED_CSV_PATH = "./cleaned_data_science_job_posts_and_salaries_2025.csv"
+CLEANED_PARQUET_PATH = "./cleaned_data_science_job_posts_and_salaries_2025.parquet"
+
+# low cardinality text columns, stored dictionary encoded and loaded as pandas categoricals
+CATEGORICAL_COLUMNS = ["job_title", "industry", "status", "seniority_level", "country_code"]
+# dtypes load_cleaned gives columns stored as text or float64 to save memory,
+# floats are only downcast if every value survives the round trip
+COMPACT_DTYPES = {
+    "ownership": "category",
+    "revenue_category": "category",
+    "company_size": "Int32",
+    "seniority_level_num": "Int8",
+    "salary_low": "float32",
+    "salary_avg": "float32",
+    "salary_high": "float32",
+}
+
+# %%
+# columns of the cleaned dataset in the same order as in the csv
+category = pa.dictionary(pa.int32(), pa.string())
+CLEANED_SCHEMA = pa.schema([
+    ("job_title", category),
+    ("seniority_level", category),
+    ("status", category),
+    ("company", pa.string()),
+    ("location", pa.string()),
+    ("post_date", pa.timestamp("ns")),
+    ("headquarter", pa.string()),
+    ("industry", category),
+    ("ownership", pa.string()),
+    ("company_size", pa.float64()),
+    ("revenue", pa.float64()),
+    ("salary", pa.string()),
+    ("skills", pa.list_(pa.string())),
+    ("revenue_category", pa.string()),
+    ("salary_low", pa.float64()),
+    ("salary_avg", pa.float64()),
+    ("salary_high", pa.float64()),
+    ("country_code", category),
+    ("seniority_level_num", pa.float64()),
+])
+
+
+def to_arrow(data):
+    """
+    Convert cleaned DataFrame (or a chunk of it) to an Arrow table with CLEANED_SCHEMA.
+    """
+    data = data[CLEANED_SCHEMA.names].copy()
+    # NaN in object columns would be rejected by the typed string fields
+    for field in CLEANED_SCHEMA:
+        if pa.types.is_string(field.type) or pa.types.is_dictionary(field.type):
+            data[field.name] = data[field.name].astype(object).where(data[field.name].notna(), None)
+    data["skills"] = pd.Series(
+        [list(skills) if isinstance(skills, (list, np.ndarray)) else None for skills in data.skills],
+        index=data.index, dtype=object,
+    )
+    return pa.Table.from_pandas(data, schema=CLEANED_SCHEMA, preserve_index=False)
+
+
+def parquet_writer(path=CLEANED_PARQUET_PATH):
+    """
+    Open Parquet writer for the cleaned dataset, every written chunk becomes a row group.
+    """
+    return pq.ParquetWriter(path, CLEANED_SCHEMA)
+
+
+# %%
+def parse_skills(skills):
+    """
+    Parse string representations of skill lists as stored in the csv, missing values stay NaN.
+    """
+    offsets, ids, vocabulary = skill_index.parse_skill_lists(skills)
+    parsed = pd.Series(skill_index.skill_lists(offsets, ids, vocabulary), index=skills.index, dtype=object)
+    return parsed.where(skills.notna(), np.nan)
+
+
+def cleaned_data_path(parquet_path=CLEANED_PARQUET_PATH, csv_path=CLEANED_CSV_PATH):
+    """
+    Path of the file load_cleaned reads: the Parquet file unless it is missing or older than the csv,
+    e.g. left over from an earlier run of data_cleaning.py with --parquet-output ''.
+    Pass csv_path=None to never fall back to the csv.
+    """
+    if not os.path.exists(parquet_path):
+        return csv_path
+    if csv_path and os.path.exists(csv_path) and os.path.getmtime(csv_path) > os.path.getmtime(parquet_path):
+        return csv_path
+    return parquet_path
+
+
+def row_count(path):
+    """
+    Number of rows of a cleaned dataset file, read from the Parquet footer without scanning the rows.
+    """
+    if path.endswith(".parquet"):
+        return pq.ParquetFile(path).metadata.num_rows
+    return len(pd.read_csv(path, usecols=[0]))
+
+
+def sorted_categories(column):
+    column = column.astype("category")
+    return column.cat.reorder_categories(sorted(column.cat.categories))
+
+
+def compact_dtypes(df, dtypes=COMPACT_DTYPES):
+    """
+    Convert columns of df to dtypes, integer and float32 columns only where no value changes.
+    """
+    df = df.copy(deep=False)
+    for col, dtype in dtypes.items():
+        if col not in df:
+            continue
+        if dtype == "category":
+            df[col] = sorted_categories(df[col])
+            continue
+        try:
+            converted = df[col].astype(dtype)
+        except (TypeError, ValueError):  # fractions or values out of the integer range
+            continue
+        same = (converted.astype("float64") == df[col]) | df[col].isna()
+        if same.all():
+            df[col] = converted
+    return df
+
+
+def memory_report(before, after):
+    """
+    Deep memory usage in MB and dtypes of every column of the frame before and after compact_dtypes.
+    """
+    report = pd.DataFrame({
+        "dtype_before": before.dtypes.astype(str),
+        "mb_before": before.memory_usage(deep=True, index=False) / 2 ** 20,
+        "dtype_after": after.dtypes.astype(str),
+        "mb_after": after.memory_usage(deep=True, index=False) / 2 ** 20,
+    })
+    report.loc["total"] = ["", report["mb_before"].sum(), "", report["mb_after"].sum()]
+    return report
+
+
+def load_cleaned(parquet_path=CLEANED_PARQUET_PATH, csv_path=CLEANED_CSV_PATH, columns=None, compact=True):
+    """
+    Load cleaned dataset from the Parquet file through memory mapping,
+    fall back to parsing the csv if the Parquet file is missing or stale, see cleaned_data_path.
+
+    Both ways give the same dtypes: CATEGORICAL_COLUMNS are categoricals with sorted
+    categories and skills holds sequences of strings. With compact, columns also get
+    COMPACT_DTYPES, nullable integers and float32 salaries, compute with float64 copies of them.
+    """
+    if cleaned_data_path(parquet_path, csv_path) == parquet_path:
+        df = pq.read_table(parquet_path, columns=columns, memory_map=True).to_pandas()
+    else:
+        df = pd.read_csv(csv_path, usecols=columns, float_precision="round_trip")
+        if "post_date" in df:
+            df["post_date"] = pd.to_datetime(df["post_date"])
+        if "skills" in df:
+            df["skills"] = parse_skills(df["skills"])
+    for col in CATEGORICAL_COLUMNS:
+        if col in df:
+            df[col] = sorted_categories(df[col])
+    return compact_dtypes(df) if compact else df
+
+
+# %%
+if __name__ == "__main__":
+    df = load_cleaned(compact=False)
+    print(memory_report(df, compact_dtypes(df)).to_string(float_format="{:.3f}".format))
@@ -1,220 +1,462 @@
 # %%
 import numpy as np
 import pandas as pd
-import subprocess
-import ast
+import argparse
+import collections
+import contextlib
+import functools
+import hashlib
+import itertools
+import os
+import pathlib
+import re
+import shutil
+import sys
+import tempfile
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, timedelta, timezone
+
+import pyarrow as pa
+import pyarrow.compute as pc
+
+import cleaned_data
+import instrumentation
+import skill_index
+import stage_cache
 
 # %%
-data = pd.read_csv("./data_science_job_posts_and_salaries_2025.zip")
+INPUT_PATH = "./data_science_job_posts_and_salaries_2025.zip"
+OUTPUT_PATH = cleaned_data.CLEANED_CSV_PATH
+PARQUET_OUTPUT_PATH = cleaned_data.CLEANED_PARQUET_PATH
+SKILL_INDEX_OUTPUT_PATH = skill_index.SKILL_INDEX_PATH
+# uncompressed copies of raw archives for --raw-cache
+RAW_CACHE_DIR = "./.raw_cache"
+# raw columns no cleaning stage or analysis reads, --skip-columns leaves them empty in the output
+UNUSED_RAW_COLUMNS = ["headquarter"]
 
 # %%
-# remove , and € from non-money columns, remove suspricios records, parse revenue strings
-data.salary = data.salary.str.replace(",", "").str.replace("€", "")
-data.revenue = data.revenue.str.replace(",", "").str.replace("€", "")
-data.company_size[data.company_size.str.contains("€")] = None
-data.company_size = data.company_size.str.replace(",", "")
-data.company_size = pd.to_numeric(data["company_size"], errors="coerce")
-data["revenue_category"] = np.where(
-    data.revenue.str.contains(r"\d+.\d+[MBT]", regex=True).fillna(False),
-    np.nan,
-    data.revenue,
-)
-data["revenue"] = np.where(
-    data.revenue.str.contains(r"\d+.\d+[MBT]", regex=True).fillna(False),
-    data.revenue,
-    np.nan,
-)
-data.revenue = [float(x[:-1]) * {"M":1e6, "B":1e9, "T":1e12}.get(x[-1], 1) if type(x)==str else None for x in data.revenue]
+# amounts like €118,736, 913.33M or €1.45T: optional euro sign, digits with thousands separators,
+# optional fraction and magnitude suffix, matched by Arrow's regex engine instead of row by row
+MAGNITUDES = {"M": 1e6, "B": 1e9, "T": 1e12}
+
+
+def amount_groups(prefix=""):
+    return rf"(?P<{prefix}currency>€)?\s*(?P<{prefix}number>\d[\d,]*(?:\.\d*)?)\s*(?P<{prefix}magnitude>[MBT])?"
+
+
+AMOUNT_PATTERN = rf"^\s*{amount_groups()}\s*$"
+
+
+def arrow_strings(values):
+    return pa.array(values.to_numpy(dtype=object), type=pa.string(), from_pandas=True)
+
+
+def extract(values, pattern):
+    """
+    Named groups of pattern in every value as Arrow arrays, null where the value doesn't match.
+    """
+    parts = pc.extract_regex(arrow_strings(values), pattern)
+    return {field.name: pc.struct_field(parts, field.name) for field in parts.type}
+
+
+def to_amounts(groups, prefix="", index=None):
+    """
+    Amounts from the groups of amount_groups(prefix) found by extract.
+
+    Returns DataFrame with amount (NaN where the value isn't an amount),
+    currency and magnitude columns telling whether the value had the € sign and a M/B/T suffix.
+    """
+    number = pc.replace_substring(groups[f"{prefix}number"], ",", "")
+    # groups of an optional part that didn't match are empty strings
+    number = pc.cast(pc.if_else(pc.equal(number, ""), pa.scalar(None, pa.string()), number), pa.float64())
+    suffix = pc.index_in(groups[f"{prefix}magnitude"], value_set=pa.array(list(MAGNITUDES)))
+    scale = np.array([1.0, *MAGNITUDES.values()])[suffix.fill_null(-1).to_numpy() + 1]
+    return pd.DataFrame({
+        "amount": number.to_numpy(zero_copy_only=False) * scale,
+        "currency": pc.equal(groups[f"{prefix}currency"], "€").fill_null(False).to_numpy(zero_copy_only=False),
+        "magnitude": suffix.is_valid().to_numpy(zero_copy_only=False),
+    }, index=index)
+
+
+def parse_amounts(values):
+    """
+    Parse currency and magnitude strings like "€118,736" or "913.33M" in one columnar pass.
+    """
+    return to_amounts(extract(values, AMOUNT_PATTERN), index=values.index)
+
+
+# remove , and € from salary, parse revenue strings, drop revenues found in company size
+def clean_money_columns(data):
+    salary = pc.replace_substring_regex(arrow_strings(data.salary), "[,€]", "")
+    data["salary"] = pd.Series(salary.to_numpy(zero_copy_only=False), index=data.index).where(data.salary.notna())
+    # revenue holds scaled amounts like €913.33M or a category like private or public
+    revenue = parse_amounts(data.revenue)
+    data["revenue_category"] = data.revenue.where(~revenue.magnitude)
+    data["revenue"] = revenue.amount.where(revenue.magnitude)
+    # float even for chunks without missing values
+    size = parse_amounts(data.company_size)
+    data["company_size"] = size.amount.where(~size.currency & ~size.magnitude)
+    return data
 
 # %%
 text_columns = ["job_title", "location", "company", "industry", "ownership", "seniority_level", "status"]
-for col in text_columns:
-    data[col] = data[col].str.lower().str.strip()
+
+
+def normalize_text_columns(data):
+    for col in text_columns:
+        data[col] = data[col].str.lower().str.strip()
+    return data
 
 # %%
 # parse salary ranges into separate columns
-for idx, salary_str in data.salary.items():
-    if '-' in salary_str:
-        low, high = salary_str.split(' - ')
-        low = float(low)
-        high = float(high)
-        salary = (low + high) / 2
-    else:
-        salary = float(salary_str)
-        low = salary
-        high = salary
-    data.at[idx, 'salary_low'] = low
-    data.at[idx, 'salary_avg'] = salary
-    data.at[idx, 'salary_high'] = high
+SALARY_RANGE_PATTERN = rf"^\s*{amount_groups('low_')}\s*(?:-\s*{amount_groups('high_')}\s*)?$"
+
+
+def parse_salary_ranges(salary):
+    """
+    Parse "low - high" or single value salary strings like "€118,736 - €237,469" or "118736".
+
+    Returns DataFrame with salary_low, salary_avg and salary_high columns aligned with salary,
+    rows that can't be parsed are left as NaN instead of raising.
+    """
+    groups = extract(salary, SALARY_RANGE_PATTERN)
+    low = to_amounts(groups, "low_", salary.index).amount
+    high = to_amounts(groups, "high_", salary.index).amount.fillna(low)
+    return pd.DataFrame({
+        "salary_low": low,
+        "salary_avg": (low + high) / 2,
+        "salary_high": high,
+    })
+
+
+def add_salary_columns(data):
+    salaries = parse_salary_ranges(data.salary)
+    unparsed_salary = salaries.salary_avg.isna()
+    if unparsed_salary.any():
+        print(f"Could not parse salary in {unparsed_salary.sum()} rows:")
+        print(data.loc[unparsed_salary, "salary"].to_string())
+    data[salaries.columns] = salaries
+    return data
 
 # %%
 # parse post_date strings into datetime, it uses relative format e.g. a month ago or 2 days ago
-data.post_date = pd.to_datetime([
-    subprocess.run(
-        ("date", "-d", f"2025-10-02 + {datestr}", "+%F"),
-        capture_output=True
-    ).stdout.decode("utf-8").strip() for datestr in data.post_date
-])
+# dataset was collected on Oct 2, 2025 so relative dates are anchored there
+REFERENCE_DATE = "2025-10-02"
+
+# relative units understood by GNU date, as (years, months, days, seconds)
+RELATIVE_DATE_UNITS = {
+    "year": (1, 0, 0, 0),
+    "month": (0, 1, 0, 0),
+    "fortnight": (0, 0, 14, 0),
+    "week": (0, 0, 7, 0),
+    "day": (0, 0, 1, 0),
+    "hour": (0, 0, 0, 3600),
+    "minute": (0, 0, 0, 60),
+    "min": (0, 0, 0, 60),
+    "second": (0, 0, 0, 1),
+    "sec": (0, 0, 0, 1),
+}
+RELATIVE_DATE_WORDS = {
+    "now": (0, 0, 0, 0),
+    "today": (0, 0, 0, 0),
+    "yesterday": (0, 0, -1, 0),
+    "tomorrow": (0, 0, 1, 0),
+}
+# single letters are military time zones for GNU date: A-I +1..+9, K-M +10..+12, N-Y -1..-12, Z UTC
+MILITARY_TIME_ZONES = {
+    letter: timezone(timedelta(hours=offset))
+    for letter, offset in zip(
+        "abcdefghiklmnopqrstuvwxyz",
+        [*range(1, 13), *range(-1, -13, -1), 0],
+    )
+}
+
+
+def parse_relative_date(datestr, reference=REFERENCE_DATE, tz=None):
+    """
+    Parse a relative date like "2 days ago" the way `date -d "<reference> + <datestr>" +%F` does.
+
+    GNU date reads the article in "a month ago" as the military time zone A (UTC+1),
+    so the reference midnight is taken in UTC+1 and the resulting day depends on the
+    local time zone. This is reproduced to keep output identical to the date based parser.
+
+    Args:
+        datestr: relative date string
+        reference: reference date in ISO format
+        tz: time zone used to render the result, local time zone if None
+
+    Returns "YYYY-MM-DD" string or None if the string can't be parsed.
+    """
+    if not isinstance(datestr, str):
+        return None
+    tokens = datestr.lower().split()
+    zone = None
+    if tokens and tokens[0] in MILITARY_TIME_ZONES:
+        zone = MILITARY_TIME_ZONES[tokens.pop(0)]
+    years = months = days = seconds = 0
+    if len(tokens) == 1 and tokens[0] in RELATIVE_DATE_WORDS:
+        years, months, days, seconds = RELATIVE_DATE_WORDS[tokens[0]]
+    elif tokens:
+        sign = 1
+        if tokens[-1] == "ago":
+            sign = -1
+            tokens = tokens[:-1]
+        count = 1
+        if len(tokens) == 2 and tokens[0].lstrip("+-").isdigit():
+            count = int(tokens.pop(0))
+        if len(tokens) != 1:
+            return None
+        unit = tokens[0]
+        if unit not in RELATIVE_DATE_UNITS and unit.endswith("s"):
+            unit = unit[:-1]
+        if unit not in RELATIVE_DATE_UNITS:
+            return None
+        years, months, days, seconds = (sign * count * n for n in RELATIVE_DATE_UNITS[unit])
+
+    # calendar part is added to the broken down date and normalized like mktime does
+    ref = date.fromisoformat(reference)
+    year, month = divmod(ref.month - 1 + months, 12)
+    wall = datetime(ref.year + years + year, month + 1, 1) + timedelta(days=ref.day - 1 + days)
+    if zone is not None:
+        start = wall.replace(tzinfo=zone)
+    elif tz is not None:
+        start = wall.replace(tzinfo=tz)
+    else:
+        start = wall.astimezone()
+    start += timedelta(seconds=seconds)
+    return start.astimezone(tz).strftime("%Y-%m-%d")
+
+
+def parse_relative_dates(dates, reference=REFERENCE_DATE, tz=None):
+    """
+    Vectorized parse_relative_date, every distinct string is parsed only once.
+
+    Returns datetime64 Series aligned with dates, unparsable values are NaT.
+    """
+    codes, uniques = pd.factorize(dates)
+    # missing values get code -1, which picks the trailing NaT
+    parsed = pd.to_datetime(
+        [parse_relative_date(datestr, reference, tz) for datestr in uniques] + [None]
+    ).to_numpy(dtype="datetime64[ns]")
+    return pd.Series(parsed[codes], index=dates.index, name=dates.name)
+
+
+def parse_post_dates(data, reference=REFERENCE_DATE):
+    data.post_date = parse_relative_dates(data.post_date, reference)
+    return data
 
 # %%
 # drop suspicious and non-informative location entries
-data.loc[(data.location == data.status) | (data.location == "fully remote"), "location"] = None
+def drop_suspicious_locations(data):
+    data.loc[(data.location == data.status) | (data.location == "fully remote"), "location"] = None
+    return data
 
 # %%
 # parse country from location
+# US states abbreviations to identify US locations
+US_STATES = {
+    'al', 'ak', 'az', 'ar', 'ca', 'co', 'ct', 'de', 'fl', 'ga', 'hi', 'id', 
+    'il', 'in', 'ia', 'ks', 'ky', 'la', 'me', 'md', 'ma', 'mi', 'mn', 'ms', 
+    'mo', 'mt', 'ne', 'nv', 'nh', 'nj', 'nm', 'ny', 'nc', 'nd', 'oh', 'ok', 
+    'or', 'pa', 'ri', 'sc', 'sd', 'tn', 'tx', 'ut', 'vt', 'va', 'wa', 'wv', 
+    'wi', 'wy',
+    "california", "texas", "florida", "new york", "illinois", "pennsylvania",
+}
+
+# full country names and well known places, the first matching entry wins
+COUNTRY_PATTERNS = {
+    'united states': 'US',
+    'us': 'US',
+    'usa': 'US',
+    'washington': 'US',
+    'san francisco': 'US',
+    'new york': 'US',
+    'birmingham, alabama': 'US',
+    'raleigh-durham-chapel': 'US',
+    'los angeles': 'US',
+    'canada': 'CA',
+    'ontario': 'CA',
+    'quebec': 'CA',
+    'salt lake city': 'US',
+    'chicago': 'US',
+    'british columbia': 'CA',
+    'alberta': 'CA',
+    'manitoba': 'CA',
+    'saskatchewan': 'CA',
+    'nova scotia': 'CA',
+    'new brunswick': 'CA',
+    'toronto': 'CA',
+    'prince edward island': 'CA',
+    'newfoundland': 'CA',
+    'labrador': 'CA',
+    'vancouver': 'CA',
+    'uk': 'UK',
+    'united kingdom': 'UK',
+    'england': 'UK',
+    'scotland': 'UK',
+    'wales': 'UK',
+    'germany': 'DE',
+    'france': 'FR',
+    'italy': 'IT',
+    'spain': 'ES',
+    'netherlands': 'NL',
+    'japan': 'JP',
+    'china': 'CN',
+    'india': 'IN',
+    'brazil': 'BR',
+    'são paulo': 'BR',
+    'mexico': 'MX',
+    'australia': 'AU',
+    'switzerland': 'CH',
+    'poland': 'PL',
+    'czechia': 'CZ',
+    'ukraine': 'UA',
+    'estonia': 'EE',
+    'lithuania': 'LT',
+    'romania': 'RO',
+    'belgium': 'BE',
+    'austria': 'AT',
+    'sweden': 'SE',
+    'thailand': 'TH',
+    'singapore': 'SG',
+    'south africa': 'ZA',
+    'norway': 'NO',
+    'denmark': 'DK',
+    'ireland': 'IE',
+    'portugal': 'PT',
+    'hungary': 'HU',
+    'greece': 'GR',
+    'turkey': 'TR',
+    'finland': 'FI',
+    'chile': 'CL',
+    'colombia': 'CO',
+    'peru': 'PE',
+    'venezuela': 'VE',
+    'ecuador': 'EC',
+    'dominican republic': 'DO',
+    'sri lanka': 'LK',
+    'new zealand': 'NZ',
+    'philippines': 'PH',
+    'malaysia': 'MY',
+    'indonesia': 'ID',
+    'vietnam': 'VN',
+    'south korea': 'KR',
+    'russia': 'RU',
+    'belarus': 'BY',
+    'serbia': 'RS',
+    'croatia': 'HR',
+    'slovenia': 'SI',
+    'bulgaria': 'BG',
+    'israel': 'IL',
+    'uae': 'AE',
+    'saudi arabia': 'SA',
+    'kuwait': 'KW',
+    'qatar': 'QA',
+    'oman': 'OM',
+    'jordan': 'JO',
+    'lebanon': 'LB',
+    'egypt': 'EG',
+    'morocco': 'MA',
+    'tunisia': 'TN',
+    'kenya': 'KE',
+    'nigeria': 'NG',
+    'ghana': 'GH',
+    'ethiopia': 'ET',
+    'argentina': 'AR',
+    'uruguay': 'UY',
+    'paraguay': 'PY',
+    'bolivia': 'BO',
+    'suriname': 'SR',
+    'guyana': 'GY',
+    'panama': 'PA',
+    'costa rica': 'CR',
+    'honduras': 'HN',
+    'belize': 'HN',
+    'nicaragua': 'NI',
+    'el salvador': 'SV',
+    'elsalvador': 'SV',
+    'guatemala': 'GT',
+    'montenegro': 'ME',
+    'taipei': 'TW',
+    'taiwan': 'TW',
+    'bangalore': 'IN',
+    'antwerp': 'BE',
+    'bengalaru': 'IN',
+    'puerto rico': 'PR',
+    'hyderabad': 'IN',
+    'bengaluru': 'IN',
+    'mumbai': 'IN',
+}
+
+# suffix marking the end of location string so "ends with ', tx'" becomes a plain substring
+LOCATION_END = "\0"
+
+
+def build_location_patterns():
+    """
+    Flatten US state checks and country names into {substring: (priority, country_code)}.
+
+    Lower priority wins, US states come before country names as in the original sequential checks.
+    """
+    patterns = {}
+    for state in US_STATES:
+        for template in (", {} ", ", {}.", ", {},", ", {}" + LOCATION_END, " {} ."):
+            patterns.setdefault(template.format(state), (0, "US"))
+    for priority, (country_name, country_code) in enumerate(COUNTRY_PATTERNS.items(), start=1):
+        patterns.setdefault(country_name, (priority, country_code))
+    return patterns
+
+
+def compile_location_matcher(patterns):
+    """
+    Compile patterns into a single alternation regex scanning every position of the string.
+
+    Alternatives are ordered longest first, so at every position regex reports the longest
+    pattern starting there; every other pattern starting at that position is its prefix,
+    thus the best priority among the prefixes is precomputed for each pattern.
+    """
+    ordered = sorted(patterns, key=len, reverse=True)
+    regex = re.compile("(?=(" + "|".join(map(re.escape, ordered)) + "))")
+    best_match = {
+        pattern: min(patterns[prefix] for prefix in patterns if pattern.startswith(prefix))
+        for pattern in patterns
+    }
+    return regex, best_match
+
+
+LOCATION_PATTERNS = build_location_patterns()
+LOCATION_REGEX, LOCATION_BEST_MATCH = compile_location_matcher(LOCATION_PATTERNS)
+
+
 def extract_country_from_location(location):
     if pd.isna(location) or location is None:
         return None
-    
-    # US states abbreviations to identify US locations
-    us_states = {
-        'al', 'ak', 'az', 'ar', 'ca', 'co', 'ct', 'de', 'fl', 'ga', 'hi', 'id', 
-        'il', 'in', 'ia', 'ks', 'ky', 'la', 'me', 'md', 'ma', 'mi', 'mn', 'ms', 
-        'mo', 'mt', 'ne', 'nv', 'nh', 'nj', 'nm', 'ny', 'nc', 'nd', 'oh', 'ok', 
-        'or', 'pa', 'ri', 'sc', 'sd', 'tn', 'tx', 'ut', 'vt', 'va', 'wa', 'wv', 
-        'wi', 'wy',
-        "california", "texas", "florida", "new york", "illinois", "pennsylvania",
-    }
-    
-    # Check for US state codes in the location
-    for state in us_states:
-        if f', {state} ' in location or f', {state}.' in location or \
-           f', {state},' in location or location.endswith(f', {state}') or \
-           f' {state} .' in location:
-            return 'US'
-    
-    # Check for full country names in location
-    country_patterns = {
-        'united states': 'US',
-        'us': 'US',
-        'usa': 'US',
-        'washington': 'US',
-        'san francisco': 'US',
-        'new york': 'US',
-        'birmingham, alabama': 'US',
-        'raleigh-durham-chapel': 'US',
-        'los angeles': 'US',
-        'canada': 'CA',
-        'ontario': 'CA',
-        'quebec': 'CA',
-        'salt lake city': 'US',
-        'chicago': 'US',
-        'british columbia': 'CA',
-        'alberta': 'CA',
-        'manitoba': 'CA',
-        'saskatchewan': 'CA',
-        'nova scotia': 'CA',
-        'new brunswick': 'CA',
-        'toronto': 'CA',
-        'prince edward island': 'CA',
-        'newfoundland': 'CA',
-        'labrador': 'CA',
-        'vancouver': 'CA',
-        'uk': 'UK',
-        'united kingdom': 'UK',
-        'england': 'UK',
-        'scotland': 'UK',
-        'wales': 'UK',
-        'germany': 'DE',
-        'france': 'FR',
-        'italy': 'IT',
-        'spain': 'ES',
-        'netherlands': 'NL',
-        'japan': 'JP',
-        'china': 'CN',
-        'india': 'IN',
-        'brazil': 'BR',
-        'são paulo': 'BR',
-        'mexico': 'MX',
-        'australia': 'AU',
-        'switzerland': 'CH',
-        'poland': 'PL',
-        'czechia': 'CZ',
-        'ukraine': 'UA',
-        'estonia': 'EE',
-        'lithuania': 'LT',
-        'romania': 'RO',
-        'belgium': 'BE',
-        'austria': 'AT',
-        'sweden': 'SE',
-        'thailand': 'TH',
-        'singapore': 'SG',
-        'south africa': 'ZA',
-        'norway': 'NO',
-        'denmark': 'DK',
-        'ireland': 'IE',
-        'portugal': 'PT',
-        'hungary': 'HU',
-        'greece': 'GR',
-        'turkey': 'TR',
-        'finland': 'FI',
-        'chile': 'CL',
-        'colombia': 'CO',
-        'peru': 'PE',
-        'venezuela': 'VE',
-        'ecuador': 'EC',
-        'dominican republic': 'DO',
-        'sri lanka': 'LK',
-        'new zealand': 'NZ',
-        'philippines': 'PH',
-        'malaysia': 'MY',
-        'indonesia': 'ID',
-        'vietnam': 'VN',
-        'south korea': 'KR',
-        'russia': 'RU',
-        'belarus': 'BY',
-        'serbia': 'RS',
-        'croatia': 'HR',
-        'slovenia': 'SI',
-        'bulgaria': 'BG',
-        'israel': 'IL',
-        'uae': 'AE',
-        'saudi arabia': 'SA',
-        'kuwait': 'KW',
-        'qatar': 'QA',
-        'oman': 'OM',
-        'jordan': 'JO',
-        'lebanon': 'LB',
-        'egypt': 'EG',
-        'morocco': 'MA',
-        'tunisia': 'TN',
-        'kenya': 'KE',
-        'nigeria': 'NG',
-        'ghana': 'GH',
-        'ethiopia': 'ET',
-        'argentina': 'AR',
-        'uruguay': 'UY',
-        'paraguay': 'PY',
-        'bolivia': 'BO',
-        'suriname': 'SR',
-        'guyana': 'GY',
-        'panama': 'PA',
-        'costa rica': 'CR',
-        'honduras': 'HN',
-        'belize': 'HN',
-        'nicaragua': 'NI',
-        'el salvador': 'SV',
-        'elsalvador': 'SV',
-        'guatemala': 'GT',
-        'montenegro': 'ME',
-        'taipei': 'TW',
-        'taiwan': 'TW',
-        'bangalore': 'IN',
-        'antwerp': 'BE',
-        'bengalaru': 'IN',
-        'puerto rico': 'PR',
-        'hyderabad': 'IN',
-        'bengaluru': 'IN',
-        'mumbai': 'IN',
-    }
-    
-    for country_name, country_code in country_patterns.items():
-        if country_name in location:
-            return country_code
-    
-    return None
+    matches = [
+        LOCATION_BEST_MATCH[match.group(1)]
+        for match in LOCATION_REGEX.finditer(location + LOCATION_END)
+    ]
+    if not matches:
+        return None
+    return min(matches)[1]
+
 
-data['country_code'] = data['location'].apply(extract_country_from_location)
+def extract_countries(locations):
+    """
+    Bulk extract_country_from_location, every distinct location is matched only once.
+    """
+    codes, uniques = pd.factorize(locations)
+    countries = np.array(
+        [extract_country_from_location(location) for location in uniques] + [None],
+        dtype=object,
+    )
+    return pd.Series(countries[codes], index=locations.index, name=locations.name)
+
+
+def add_country_code(data):
+    data['country_code'] = extract_countries(data['location'])
+    return data
 
 # %%
 # merge skills variations
@@ -226,14 +468,18 @@ skill_mapping = {
 }
 
 
-for idx, skills_str in data.skills.items():
-    if pd.isna(skills_str) or skills_str is None:
-        data.at[idx, "skills_list"] = []
-        continue
-    
-    skills = ast.literal_eval(skills_str)
-    mapped_skills = [skill_mapping.get(skill, skill) for skill in skills]
-    data.at[idx, "skills"] = list(set(mapped_skills))
+def merge_skills(data):
+    """
+    Parse skill lists with aliases merged and duplicates removed, missing lists stay missing.
+
+    Offsets, ids and skill names of the parse are handed over in data.attrs["skill_ids"],
+    clean takes them out right after this stage.
+    """
+    offsets, ids, vocabulary = skill_index.parse_skill_lists(data.skills, mapping=skill_mapping)
+    skills = pd.Series(skill_index.skill_lists(offsets, ids, vocabulary), index=data.index, dtype=object)
+    data["skills"] = skills.where(data.skills.notna(), np.nan)
+    data.attrs["skill_ids"] = (offsets, ids, list(vocabulary))
+    return data
 
 # %%
 # seniority level is actually a numerical column, at least it has order from low to high
@@ -245,7 +491,332 @@ seniority_mapping = {
     "lead": 4,
 }
 
-data["seniority_level_num"] = data.seniority_level.map(seniority_mapping)
+
+
+def add_seniority_level_num(data):
+    data["seniority_level_num"] = data.seniority_level.map(seniority_mapping).astype(float)
+    return data
+
+# %%
+# every stage works row by row, so the pipeline can run on the whole dataset or chunk by chunk
+def cleaning_stages(reference=REFERENCE_DATE):
+    """
+    (name, stage) pairs of the pipeline in order, every stage takes and returns the DataFrame.
+    """
+    return [
+        ("clean_money_columns", clean_money_columns),
+        ("normalize_text_columns", normalize_text_columns),
+        ("add_salary_columns", add_salary_columns),
+        ("parse_post_dates", functools.partial(parse_post_dates, reference=reference)),
+        ("drop_suspicious_locations", drop_suspicious_locations),
+        ("add_country_code", add_country_code),
+        ("merge_skills", merge_skills),
+        ("add_seniority_level_num", add_seniority_level_num),
+    ]
+
+
+def clean(data, reference=REFERENCE_DATE):
+    """
+    Run the cleaning stages, returns cleaned DataFrame and (offsets, ids, names) of its skills
+    parsed by merge_skills, so the skill index is built without parsing the lists again.
+    """
+    skill_ids = None
+    for name, stage in cleaning_stages(reference):
+        data = instrumentation.run_stage(name, stage, data)
+        # pandas deep copies attrs into every derived frame and ids only match the rows they were parsed from
+        skill_ids = data.attrs.pop("skill_ids", skill_ids)
+    return data, skill_ids
+
+
+def raw_member(archive, path=INPUT_PATH):
+    """
+    Info of the single csv file in the zip archive of the raw dataset, directory entries are skipped.
+    """
+    members = [info for info in archive.infolist() if not info.is_dir()]
+    if len(members) != 1:
+        raise ValueError(f"{path} should hold a single csv file, found {len(members)} files")
+    return members[0]
+
+
+def open_raw(path=INPUT_PATH):
+    """
+    Open raw dataset as a binary stream, the csv inside a zip archive is decompressed
+    incrementally while it is read, never as a whole.
+    """
+    if not zipfile.is_zipfile(path):
+        return open(path, "rb")
+    with zipfile.ZipFile(path) as archive:
+        # the member stream keeps the archive file open after the archive is closed
+        return archive.open(raw_member(archive, path))
+
+
+def uncompressed_raw(path=INPUT_PATH, cache_dir=RAW_CACHE_DIR):
+    """
+    Path of the raw csv, zip archives are decompressed into cache_dir once
+    and reused while the archived csv stays the same.
+    """
+    if not zipfile.is_zipfile(path):
+        return path
+    with zipfile.ZipFile(path) as archive:
+        member = raw_member(archive, path)
+    # CRC and size of the archived csv identify it without decompressing,
+    # the archive's path keeps archives holding csv files of the same name apart
+    name = os.path.splitext(os.path.basename(member.filename))[0]
+    archive_key = hashlib.sha256(os.path.abspath(path).encode()).hexdigest()[:12]
+    cached_path = os.path.join(cache_dir, f"{name}-{archive_key}-{member.CRC:08x}-{member.file_size}.csv")
+    if not os.path.exists(cached_path):
+        os.makedirs(cache_dir, exist_ok=True)
+        with open_raw(path) as source, open(cached_path + ".tmp", "wb") as target:
+            shutil.copyfileobj(source, target, 1 << 20)
+        os.replace(cached_path + ".tmp", cached_path)
+    return cached_path
+
+
+def read_raw(path=INPUT_PATH, chunksize=None, skip_columns=(), cache_dir=None):
+    """
+    Read raw dataset, returns an iterator of DataFrames of at most chunksize rows.
+
+    All raw columns are text, reading them as str keeps chunks with only missing values
+    in a column from being parsed as float.
+
+    Args:
+        path: raw csv or zip archive with it, streamed through the csv parser
+        chunksize: rows per DataFrame, whole dataset at once by default
+        skip_columns: raw columns the parser drops, e.g. UNUSED_RAW_COLUMNS
+        cache_dir: decompress a zip archive once into this directory and memory map the csv from there
+    """
+    skip_columns = set(skip_columns)
+    options = {"dtype": str, "usecols": lambda column: column not in skip_columns, "memory_map": bool(cache_dir)}
+    if chunksize is None:
+        with instrumentation.stage("read_raw") as record, raw_source(path, cache_dir) as source:
+            data = pd.read_csv(source, **options)
+            record["rows_out"] = len(data)
+        return iter([data])
+    return read_raw_chunks(path, chunksize, cache_dir, options)
+
+
+def raw_source(path, cache_dir=None):
+    if cache_dir:
+        return contextlib.nullcontext(uncompressed_raw(path, cache_dir))
+    return open_raw(path)
+
+
+def read_raw_chunks(path, chunksize, cache_dir, options):
+    with raw_source(path, cache_dir) as source, pd.read_csv(source, chunksize=chunksize, **options) as reader:
+        yield from reader
+
+
+# %%
+# partitioned execution: row ranges of raw chunks are cleaned on a process pool,
+# raw text reaches workers, cleaned rows come back as Arrow IPC buffers instead of pickled DataFrames and as csv part files
+def to_ipc_buffer(data):
+    table = data if isinstance(data, pa.Table) else pa.Table.from_pandas(data, preserve_index=True)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
+
+
+def from_ipc_buffer(buffer):
+    with pa.ipc.open_stream(buffer) as reader:
+        return reader.read_all()
+
+
+def encode_cleaned(chunk, skill_ids, csv_path=None):
+    """
+    CSV rows without header, Arrow table with CLEANED_SCHEMA and (offsets, ids, names) of skills
+    of a chunk cleaned by clean, the forms write_cleaned writes, so partitions are encoded where they were cleaned.
+
+    With csv_path the rows are written to that file and its pathlib.Path is returned instead of the text.
+    """
+    # raw columns skipped by read_raw are written empty, outputs keep their columns
+    if list(chunk.columns) != cleaned_data.CLEANED_SCHEMA.names:
+        chunk = chunk.reindex(columns=cleaned_data.CLEANED_SCHEMA.names)
+    with instrumentation.stage("to_csv", len(chunk)):
+        if csv_path is None:
+            csv = chunk.to_csv(index=False, header=False)
+        else:
+            chunk.to_csv(csv_path, index=False, header=False, encoding="utf-8")
+            csv = pathlib.Path(csv_path)
+    with instrumentation.stage("to_arrow", len(chunk)):
+        table = cleaned_data.to_arrow(chunk)
+    return csv, table, skill_ids
+
+
+def clean_ipc_buffer(buffer, csv_path, reference=REFERENCE_DATE):
+    """
+    Worker side of clean_partitioned: clean the partition serialized by to_ipc_buffer
+    and write its CSV rows to csv_path.
+
+    Returns the cleaned Arrow table as IPC buffer and the parsed skills.
+    """
+    with pa.ipc.open_stream(buffer) as reader:
+        data = reader.read_pandas()
+    _, table, skill_ids = encode_cleaned(*clean(data, reference), csv_path=csv_path)
+    return to_ipc_buffer(table), skill_ids
+
+
+def clean_partitioned(chunks, reference=REFERENCE_DATE, jobs=None):
+    """
+    Clean raw chunks on a pool of jobs processes, every chunk is split into jobs row ranges.
+
+    Yields encode_cleaned output of cleaned partitions in input order, at most 2 * jobs partitions
+    are in flight so chunked input keeps bounded memory. CSV rows come as part files the workers wrote
+    into a temporary directory, so the text doesn't go through pickle, write_cleaned appends and removes them.
+    """
+    jobs = jobs or os.cpu_count()
+    pending = collections.deque()
+    parts = itertools.count()
+
+    def result(future, csv_path):
+        buffer, skill_ids = future.result()
+        return pathlib.Path(csv_path), from_ipc_buffer(buffer), skill_ids
+
+    with tempfile.TemporaryDirectory(prefix="cleaned-csv-") as csv_dir, ProcessPoolExecutor(max_workers=jobs) as pool:
+        for chunk in chunks:
+            bounds = np.linspace(0, len(chunk), jobs + 1).astype(int)
+            for start, stop in zip(bounds[:-1], bounds[1:]):
+                if start == stop and len(chunk):
+                    continue
+                csv_path = os.path.join(csv_dir, f"{next(parts):06d}.csv")
+                future = pool.submit(clean_ipc_buffer, to_ipc_buffer(chunk.iloc[start:stop]), csv_path, reference)
+                pending.append((future, csv_path))
+                if len(pending) > 2 * jobs:
+                    yield result(*pending.popleft())
+        while pending:
+            yield result(*pending.popleft())
+
+
+def write_cleaned(
+    chunks,
+    path=OUTPUT_PATH,
+    parquet_path=PARQUET_OUTPUT_PATH,
+    skill_index_path=SKILL_INDEX_OUTPUT_PATH,
+):
+    """
+    Write encode_cleaned output of chunks one after another to a single CSV file,
+    to a typed Parquet file and job x skill index unless their paths are empty.
+    CSV part files of clean_partitioned are appended and removed.
+    """
+    parquet = cleaned_data.parquet_writer(parquet_path) if parquet_path else contextlib.nullcontext()
+    vocabulary = {}
+    skill_matrices = []
+    header = pd.DataFrame(columns=cleaned_data.CLEANED_SCHEMA.names).to_csv(index=False)
+    # the Parquet file is closed last, so it isn't older than the csv and taken for a stale one
+    with parquet as writer, open(path, "w", encoding="utf-8", newline="") as csv_file:
+        csv_file.write(header)
+        for csv, table, skill_ids in chunks:
+            with instrumentation.stage("write_csv", table.num_rows):
+                if isinstance(csv, pathlib.Path):
+                    with open(csv, encoding="utf-8", newline="") as part:
+                        shutil.copyfileobj(part, csv_file, 1 << 20)
+                    os.remove(csv)
+                else:
+                    csv_file.write(csv)
+            if writer is not None:
+                with instrumentation.stage("write_parquet", table.num_rows):
+                    writer.write_table(table)
+            if skill_index_path:
+                with instrumentation.stage("build_skill_index", table.num_rows):
+                    skill_matrices.append(skill_index.skill_index_from_ids(*skill_ids, vocabulary)[0])
+    if skill_index_path:
+        with instrumentation.stage("save_skill_index"):
+            skill_index.save_skill_index(
+                skill_index.stack_skill_index(skill_matrices, vocabulary), vocabulary, skill_index_path
+            )
+
+
+def main(
+    input_path=INPUT_PATH,
+    output_path=OUTPUT_PATH,
+    chunksize=None,
+    reference=REFERENCE_DATE,
+    parquet_path=PARQUET_OUTPUT_PATH,
+    skill_index_path=SKILL_INDEX_OUTPUT_PATH,
+    use_cache=True,
+    jobs=1,
+    skip_columns=(),
+    raw_cache_dir=None,
+):
+    def run():
+        chunks = read_raw(input_path, chunksize, skip_columns, raw_cache_dir)
+        if jobs == 1:
+            cleaned = (encode_cleaned(*clean(chunk, reference)) for chunk in chunks)
+        else:
+            cleaned = clean_partitioned(chunks, reference, jobs)
+        write_cleaned(
+            cleaned,
+            output_path,
+            parquet_path,
+            skill_index_path,
+        )
+
+    if not use_cache:
+        run()
+        return
+    # output doesn't depend on chunksize, jobs or the raw cache, post dates depend on local time zone though
+    restored = stage_cache.cached_files(
+        "data_cleaning",
+        [path for path in (output_path, parquet_path, skill_index_path) if path],
+        run,
+        inputs=[input_path],
+        code=[sys.modules[__name__], cleaned_data, skill_index],
+        params={
+            "reference": reference,
+            "skip_columns": sorted(skip_columns),
+            "time_zone": time.tzname,
+            "outputs": (bool(output_path), bool(parquet_path), bool(skill_index_path)),
+        },
+    )
+    if restored:
+        print("Input and code are unchanged, cleaned dataset restored from cache")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Clean raw job postings dataset")
+    parser.add_argument("--input", default=INPUT_PATH, help="raw dataset, csv or zipped csv")
+    parser.add_argument("--output", default=OUTPUT_PATH, help="cleaned csv")
+    parser.add_argument(
+        "--parquet-output", default=PARQUET_OUTPUT_PATH,
+        help="cleaned dataset with typed columns for analysis scripts, pass empty string to skip",
+    )
+    parser.add_argument(
+        "--skill-index-output", default=SKILL_INDEX_OUTPUT_PATH,
+        help="job x skill matrix for skill analysis, pass empty string to skip",
+    )
+    parser.add_argument(
+        "--chunksize", type=int, default=None,
+        help="process raw dataset in batches of this many rows to bound memory, whole file at once by default",
+    )
+    parser.add_argument(
+        "--reference-date", default=REFERENCE_DATE,
+        help="date the dataset was collected on, relative post dates are anchored there",
+    )
+    parser.add_argument(
+        "--no-cache", action="store_true",
+        help="clean even if input and code didn't change since a cached run",
+    )
+    parser.add_argument(
+        "--jobs", type=int, default=1,
+        help="number of worker processes cleaning row ranges in parallel, 0 for all cores, "
+             "1 cleans in the main process",
+    )
+    parser.add_argument(
+        "--skip-columns", nargs="*", default=[], metavar="COLUMN",
+        help="raw columns not to read, they are left empty in the outputs, "
+             f"e.g. {' '.join(UNUSED_RAW_COLUMNS)} which no analysis uses",
+    )
+    parser.add_argument(
+        "--raw-cache", action="store_true",
+        help=f"decompress zipped input once into {RAW_CACHE_DIR} and memory map it on later runs",
+    )
+    return parser.parse_args(argv)
 
 # %%
-data.to_csv("./cleaned_data_science_job_posts_and_salaries_2025.csv", index=False)
+if __name__ == "__main__":
+    args = parse_args()
+    main(
+        args.input, args.output, args.chunksize, args.reference_date,
+        args.parquet_output, args.skill_index_output, not args.no_cache, args.jobs,
+        args.skip_columns, RAW_CACHE_DIR if args.raw_cache else None,
+    )
@@ -18,6 +18,8 @@
             python3
             python3Packages.numpy
             python3Packages.pandas
+            python3Packages.pyarrow
+            python3Packages.duckdb
             python3Packages.scipy
             python3Packages.matplotlib
             python3Packages.seaborn
@@ -1,222 +1,274 @@
 # %%
-import numpy as np
-import pandas as pd
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import matplotlib
+matplotlib.use("Agg")  # figures are only saved to files
 import matplotlib.pyplot as plt
 import seaborn as sns
 
+import cleaned_data
+import lazy_frame
+import quantile_sketch
+import salary_cube
+import salary_normalization
+import skill_index
+from cleaned_data import cleaned_data_path
+from salary_cube import build_cube, query
+from skill_index import SKILL_INDEX_PATH, calculate_skill_prices
+from stage_cache import cached
+
 # Set style for better-looking plots
 plt.style.use('seaborn-v0_8')
 #sns.set_palette("husl")
 
-# %% 
-# Load the data
-df = pd.read_csv("./cleaned_data_science_job_posts_and_salaries_2025.csv")
-
 # %%
-# Define IQR filtering and normalization functions
-def iqr_filter(group):
-    if len(group) < 4:
-        return group
-    Q1 = group["salary_avg"].quantile(0.25)
-    Q3 = group["salary_avg"].quantile(0.75)
-    IQR = Q3 - Q1
-    filtered_group = group[(group["salary_avg"] >= Q1 - 1.5 * IQR) & (group["salary_avg"] <= Q3 + 1.5 * IQR)]
-    return filtered_group
-
-def normalize_salary(group):
-    mean_val = group["salary_avg"].mean()
-    std_val = group["salary_avg"].std()
-    
-    # Handle case where standard deviation is 0 (or very close to 0)
-    if std_val == 0 or pd.isna(std_val):
-        group["salary_avg_normalized"] = 0  # If std is 0, all values are the same, so normalized value is 0
-    else:
-        group["salary_avg_normalized"] = (group["salary_avg"] - mean_val) / std_val
-    return group
+# columns the figures and the cube read, other columns of the cleaned dataset are never loaded
+FIGURE_COLUMNS = [
+    "seniority_level", "seniority_level_num", "status", "industry", "country_code", "company_size", "salary_avg",
+]
+
+
+def normalized_frames():
+    """
+    Filtered and unfiltered normalized frames of FIGURE_COLUMNS from a single lazy plan.
+    """
+    jobs = lazy_frame.scan(columns=FIGURE_COLUMNS)
+    filtered, unfiltered = lazy_frame.filter_and_normalize(jobs, "country_code")
+    return lazy_frame.collect(filtered), lazy_frame.collect(unfiltered)
 
-# %%
-# Apply IQR filtering and normalization
-df_unfiltered = df.copy()
-df = df.groupby("country_code").apply(iqr_filter).reset_index(drop=True)
-df = df.groupby("country_code").apply(normalize_salary).reset_index(drop=True)
-df_unfiltered = df_unfiltered.groupby("country_code").apply(normalize_salary).reset_index(drop=True)
+
+def prepare_frames():
+    """
+    Data shared by all figures: filtered and unfiltered normalized frames, skill prices
+    and cube of normalized salary aggregates the bar charts are drawn from.
+    """
+    # Load the data, apply IQR filtering and normalization
+    # original index is kept, skill index rows follow rows of the cleaned dataset
+    # results are cached until cleaned dataset or the code changes
+    df, df_unfiltered = cached(
+        "filter_and_normalize",
+        normalized_frames,
+        inputs=[cleaned_data_path()],
+        code=[cleaned_data, salary_normalization, lazy_frame, normalized_frames],
+        params={"by": "country_code", "columns": FIGURE_COLUMNS},
+    )
+
+    # Calculate skill prices with normalized salaries (filtered)
+    skill_df_filtered_normalized = cached(
+        "skill_prices",
+        lambda: calculate_skill_prices(df, use_normalized=True),
+        inputs=[cleaned_data_path(), SKILL_INDEX_PATH],
+        code=[cleaned_data, salary_normalization, lazy_frame, normalized_frames, skill_index],
+        params={"by": "country_code", "columns": FIGURE_COLUMNS, "filtered": True, "use_normalized": True},
+    )
+    skill_df_filtered_normalized = skill_df_filtered_normalized.sort_values(by='average_salary', ascending=False)
+
+    cube = cached(
+        "salary_cube",
+        lambda: build_cube(df_unfiltered, measure="salary_avg_normalized"),
+        inputs=[cleaned_data_path()],
+        # the cube is built from the normalized frames, so their code is part of the key
+        code=[cleaned_data, salary_normalization, lazy_frame, normalized_frames, quantile_sketch, salary_cube],
+        params={"by": "country_code", "columns": FIGURE_COLUMNS, "measure": "salary_avg_normalized"},
+    )
+    return {
+        "df": df,
+        "df_unfiltered": df_unfiltered,
+        "skill_df_filtered_normalized": skill_df_filtered_normalized,
+        "cube": cube,
+    }
 
 # %%
 # Create salary distribution before filtering
-plt.figure(figsize=(12, 8))
-plt.hist(df_unfiltered["salary_avg"], bins=100, density=True, alpha=0.7, color='skyblue', edgecolor='black')
-plt.xlabel("Salary", fontsize=14)
-plt.ylabel("Density", fontsize=14)
-plt.grid(axis='y', alpha=0.3)
-plt.tight_layout()
-plt.savefig("./salary_dist_before.png", dpi=150, bbox_inches='tight')
-plt.close()
+def plot_salary_dist_before(frames, path):
+    df_unfiltered = frames["df_unfiltered"]
+    plt.figure(figsize=(12, 8))
+    plt.hist(df_unfiltered["salary_avg"], bins=100, density=True, alpha=0.7, color='skyblue', edgecolor='black')
+    plt.xlabel("Salary", fontsize=14)
+    plt.ylabel("Density", fontsize=14)
+    plt.grid(axis='y', alpha=0.3)
+    plt.tight_layout()
+    plt.savefig(path, dpi=150, bbox_inches='tight')
+    plt.close()
 
 # %%
 # Create salary distribution after filtering
-plt.figure(figsize=(12, 8))
-plt.hist(df["salary_avg_normalized"], bins=100, density=True, alpha=0.7, color='lightgreen', edgecolor='black')
-plt.xlabel("Normalized Salary (Z-Score)", fontsize=14)
-plt.ylabel("Density", fontsize=14)
-plt.grid(axis='y', alpha=0.3)
-plt.tight_layout()
-plt.savefig("./salary_dist_after.png", dpi=150, bbox_inches='tight')
-plt.close()
+def plot_salary_dist_after(frames, path):
+    df = frames["df"]
+    plt.figure(figsize=(12, 8))
+    plt.hist(df["salary_avg_normalized"], bins=100, density=True, alpha=0.7, color='lightgreen', edgecolor='black')
+    plt.xlabel("Normalized Salary (Z-Score)", fontsize=14)
+    plt.ylabel("Density", fontsize=14)
+    plt.grid(axis='y', alpha=0.3)
+    plt.tight_layout()
+    plt.savefig(path, dpi=150, bbox_inches='tight')
+    plt.close()
 
 # %%
 # number of job postings by seniority level
-plt.figure(figsize=(12, 6))
-df_unfiltered.groupby("seniority_level").salary.count().plot.bar()
-plt.ylabel("Number of Job Postings", fontsize=14)
-plt.xlabel("")
-plt.xticks(rotation=0, fontsize=12)
-plt.grid(axis='y', alpha=0.3)
-plt.tight_layout()
-plt.savefig("./job_postings_by_seniority.png", dpi=150, bbox_inches='tight')
-plt.close()
+def plot_job_postings_by_seniority(frames, path):
+    plt.figure(figsize=(12, 6))
+    query(frames["cube"], ["seniority_level"])["n"].sort_index().plot.bar()
+    plt.ylabel("Number of Job Postings", fontsize=14)
+    plt.xlabel("")
+    plt.xticks(rotation=0, fontsize=12)
+    plt.grid(axis='y', alpha=0.3)
+    plt.tight_layout()
+    plt.savefig(path, dpi=150, bbox_inches='tight')
+    plt.close()
 
 # %%
 # number of job postings by industry
-plt.figure(figsize=(12, 6))
-df_unfiltered.groupby("industry").salary.count().sort_values(ascending=False).head(10).plot.bar()
-plt.xlabel("")
-plt.ylabel("Number of Job Postings", fontsize=14)
-plt.xticks(rotation=0, fontsize=12)
-plt.grid(axis='y', alpha=0.3)
-plt.tight_layout()
-plt.savefig("./job_postings_by_industry.png", dpi=150, bbox_inches='tight')
-plt.close()
+def plot_job_postings_by_industry(frames, path):
+    plt.figure(figsize=(12, 6))
+    query(frames["cube"], ["industry"])["n"].sort_index().sort_values(ascending=False).head(10).plot.bar()
+    plt.xlabel("")
+    plt.ylabel("Number of Job Postings", fontsize=14)
+    plt.xticks(rotation=0, fontsize=12)
+    plt.grid(axis='y', alpha=0.3)
+    plt.tight_layout()
+    plt.savefig(path, dpi=150, bbox_inches='tight')
+    plt.close()
 
 # %%
 # Create boxplot of salary by seniority level
-plt.figure(figsize=(12, 6))
-df_unfiltered.boxplot(column="salary_avg_normalized", by="seniority_level_num", ax=plt.gca())
-plt.xlabel("Seniority Level", fontsize=14)
-plt.ylabel("Normalized Salary", fontsize=14)
-plt.suptitle("")  # Remove the automatic pandas suptitle
-plt.title("")
-plt.tight_layout()
-plt.savefig("./salary_by_seniority.png", dpi=150, bbox_inches='tight')
-plt.close()
+def plot_salary_by_seniority(frames, path):
+    df_unfiltered = frames["df_unfiltered"]
+    plt.figure(figsize=(12, 6))
+    df_unfiltered.boxplot(column="salary_avg_normalized", by="seniority_level_num", ax=plt.gca())
+    plt.xlabel("Seniority Level", fontsize=14)
+    plt.ylabel("Normalized Salary", fontsize=14)
+    plt.suptitle("")  # Remove the automatic pandas suptitle
+    plt.title("")
+    plt.tight_layout()
+    plt.savefig(path, dpi=150, bbox_inches='tight')
+    plt.close()
 
 # %%
 # Create scatter plot of company size vs salary
-plt.figure(figsize=(12, 6))
-plt.scatter(df["company_size"], df["salary_avg_normalized"], alpha=0.6)
-plt.xlabel("Company Size", fontsize=14)
-plt.ylabel("Normalized Salary", fontsize=14)
-plt.grid(True, alpha=0.3)
-plt.tight_layout()
-plt.savefig("./salary_by_company_size.png", dpi=150, bbox_inches='tight')
-plt.close()
+def plot_salary_by_company_size(frames, path):
+    df = frames["df"]
+    plt.figure(figsize=(12, 6))
+    plt.scatter(df["company_size"], df["salary_avg_normalized"], alpha=0.6)
+    plt.xlabel("Company Size", fontsize=14)
+    plt.ylabel("Normalized Salary", fontsize=14)
+    plt.grid(True, alpha=0.3)
+    plt.tight_layout()
+    plt.savefig(path, dpi=150, bbox_inches='tight')
+    plt.close()
 
 # %%
 # Create bar chart of salary by industry
-plt.figure(figsize=(14, 6))
-df_unfiltered.groupby("industry").salary_avg_normalized.median().sort_values(ascending=False).plot(kind="bar")
-plt.xlabel("Industry", fontsize=14)
-plt.ylabel("Median Normalized Salary", fontsize=14)
-plt.xticks(rotation=45, ha='right')
-plt.tight_layout()
-plt.savefig("./salary_by_industry.png", dpi=150, bbox_inches='tight')
-plt.close()
+def plot_salary_by_industry(frames, path):
+    plt.figure(figsize=(14, 6))
+    query(frames["cube"], ["industry"])["q0.5"].sort_index().sort_values(ascending=False).plot(kind="bar")
+    plt.xlabel("Industry", fontsize=14)
+    plt.ylabel("Median Normalized Salary", fontsize=14)
+    plt.xticks(rotation=45, ha='right')
+    plt.tight_layout()
+    plt.savefig(path, dpi=150, bbox_inches='tight')
+    plt.close()
 
 # %%
 # Create boxplot of salary by job status (remote/onsite)
-plt.figure(figsize=(12, 6))
-df.boxplot(column="salary_avg_normalized", by="status", ax=plt.gca())
-plt.xlabel("Job Status", fontsize=14)
-plt.ylabel("Normalized Salary", fontsize=14)
-plt.suptitle("")
-plt.title("")
-plt.tight_layout()
-plt.savefig("./remote_vs_onsite_salary.png", dpi=150, bbox_inches='tight')
-plt.close()
+def plot_remote_vs_onsite_salary(frames, path):
+    df = frames["df"]
+    plt.figure(figsize=(12, 6))
+    df.boxplot(column="salary_avg_normalized", by="status", ax=plt.gca())
+    plt.xlabel("Job Status", fontsize=14)
+    plt.ylabel("Normalized Salary", fontsize=14)
+    plt.suptitle("")
+    plt.title("")
+    plt.tight_layout()
+    plt.savefig(path, dpi=150, bbox_inches='tight')
+    plt.close()
 
 # %%
-# Generate skill analysis graphs from skill_analysis.py
-import ast  # To safely evaluate string representations of Python literals
+# Create top 10 highest paying skills plot
+def plot_top_10_highest_paying_skills(frames, path):
+    skill_df_filtered_normalized = frames["skill_df_filtered_normalized"]
+    plt.figure(figsize=(14, 6))
+    top_10_highest = skill_df_filtered_normalized.head(10)
+    plt.barh(range(len(top_10_highest)), top_10_highest['average_salary'], color='coral')
+    plt.yticks(range(len(top_10_highest)), top_10_highest.index, fontsize=12)
+    plt.xlabel('Average Normalized Salary', fontsize=14)
+    plt.gca().invert_yaxis()  # Invert y-axis so highest salary is at top
+    plt.tight_layout()
+    plt.savefig(path, dpi=150, bbox_inches='tight')
+    plt.close()
 
-def calculate_skill_prices(df, use_normalized=False):
-    """
-    Calculate the average salary for each skill by:
-    1. Parsing the skills column (which contains string representations of lists)
-    2. Creating a mapping from each skill to the salaries of jobs requiring that skill
-    3. Calculating the average salary for each skill
-    
-    Args:
-        df: DataFrame with job data
-        use_normalized: Whether to use normalized salary instead of raw salary
-    """
-    # Create a dictionary to store skills and their associated salaries
-    skill_salaries = {}
-    
-    # Determine which salary column to use
-    salary_col = "salary_avg_normalized" if use_normalized else "salary_avg"
-    
-    # Iterate through each row in the dataframe
-    for idx, row in df.iterrows():
-        # Convert the string representation of the list to an actual list
-        try:
-            skills_list = ast.literal_eval(row['skills'])
-            salary_avg = row[salary_col]
-            
-            # For each skill in the list, add the salary to that skill's list
-            if isinstance(skills_list, list) and len(skills_list) > 0:
-                for skill in skills_list:
-                    skill = skill.lower().strip()  # Normalize the skill name
-                    if skill not in skill_salaries:
-                        skill_salaries[skill] = []
-                    skill_salaries[skill].append(salary_avg)
-        except (ValueError, SyntaxError):
-            # If there's an error in parsing the skills, skip this row
-            continue
-    
-    # Calculate the average salary for each skill
-    skill_prices = {}
-    for skill, salaries in skill_salaries.items():
-        skill_prices[skill] = {
-            'average_salary': np.mean(salaries),
-            'count': len(salaries),
-            'min_salary': np.min(salaries),
-            'max_salary': np.max(salaries),
-            'std_deviation': np.std(salaries)
-        }
-    
-    return skill_prices
+# %%
+# Create top 10 most common skills plot
+def plot_top_10_most_common_skills(frames, path):
+    skill_df_filtered_normalized = frames["skill_df_filtered_normalized"]
+    plt.figure(figsize=(14, 6))
+    skill_df_by_count = skill_df_filtered_normalized.sort_values(by='count', ascending=False)
+    top_10_common = skill_df_by_count.head(10)
+    plt.barh(range(len(top_10_common)), top_10_common['count'], color='lightblue')
+    plt.yticks(range(len(top_10_common)), top_10_common.index, fontsize=12)
+    plt.xlabel('Number of Job Postings', fontsize=14)
+    plt.gca().invert_yaxis()  # Invert y-axis for consistency
+    plt.tight_layout()
+    plt.savefig(path, dpi=150, bbox_inches='tight')
+    plt.close()
 
 # %%
-# Calculate skill prices with normalized salaries (filtered)
-skill_analysis_filtered_normalized = calculate_skill_prices(df, use_normalized=True)
+# every figure is an independent render job: name -> (plot function, output file)
+FIGURES = {
+    "salary_dist_before": (plot_salary_dist_before, "./salary_dist_before.png"),
+    "salary_dist_after": (plot_salary_dist_after, "./salary_dist_after.png"),
+    "job_postings_by_seniority": (plot_job_postings_by_seniority, "./job_postings_by_seniority.png"),
+    "job_postings_by_industry": (plot_job_postings_by_industry, "./job_postings_by_industry.png"),
+    "salary_by_seniority": (plot_salary_by_seniority, "./salary_by_seniority.png"),
+    "salary_by_company_size": (plot_salary_by_company_size, "./salary_by_company_size.png"),
+    "salary_by_industry": (plot_salary_by_industry, "./salary_by_industry.png"),
+    "remote_vs_onsite_salary": (plot_remote_vs_onsite_salary, "./remote_vs_onsite_salary.png"),
+    "top_10_highest_paying_skills": (plot_top_10_highest_paying_skills, "./top_10_highest_paying_skills.png"),
+    "top_10_most_common_skills": (plot_top_10_most_common_skills, "./top_10_most_common_skills.png"),
+}
 
-# Convert to DataFrame
-skill_df_filtered_normalized = pd.DataFrame(skill_analysis_filtered_normalized).T
-skill_df_filtered_normalized.index.name = 'skill'
-skill_df_filtered_normalized = skill_df_filtered_normalized.sort_values(by='average_salary', ascending=False)
+# frames prepared in the main process, handed to every worker once at its start
+worker_frames = None
 
-# %%
-# Create top 10 highest paying skills plot
-plt.figure(figsize=(14, 6))
-top_10_highest = skill_df_filtered_normalized.head(10)
-plt.barh(range(len(top_10_highest)), top_10_highest['average_salary'], color='coral')
-plt.yticks(range(len(top_10_highest)), top_10_highest.index, fontsize=12)
-plt.xlabel('Average Normalized Salary', fontsize=14)
-plt.gca().invert_yaxis()  # Invert y-axis so highest salary is at top
-plt.tight_layout()
-plt.savefig("./top_10_highest_paying_skills.png", dpi=150, bbox_inches='tight')
-plt.close()
+
+def init_worker(frames):
+    global worker_frames
+    worker_frames = frames
+
+
+def render(name):
+    plot, path = FIGURES[name]
+    plot(worker_frames, path)
+    return path
+
+
+def render_figures(names, frames, jobs=None):
+    """
+    Render figures on a process pool, jobs=1 renders them one by one in this process.
+    """
+    if jobs == 1:
+        init_worker(frames)
+        return [render(name) for name in names]
+    with ProcessPoolExecutor(max_workers=jobs, initializer=init_worker, initargs=(frames,)) as pool:
+        return list(pool.map(render, names))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Generate graphs for the slides")
+    parser.add_argument(
+        "--only", nargs="+", choices=list(FIGURES), metavar="FIGURE",
+        help="render only these figures: " + ", ".join(FIGURES),
+    )
+    parser.add_argument(
+        "--jobs", type=int, default=os.cpu_count(),
+        help="number of worker processes, 1 renders in the main process",
+    )
+    return parser.parse_args(argv)
 
 # %%
-# Create top 10 most common skills plot
-plt.figure(figsize=(14, 6))
-skill_df_by_count = skill_df_filtered_normalized.sort_values(by='count', ascending=False)
-top_10_common = skill_df_by_count.head(10)
-plt.barh(range(len(top_10_common)), top_10_common['count'], color='lightblue')
-plt.yticks(range(len(top_10_common)), top_10_common.index, fontsize=12)
-plt.xlabel('Number of Job Postings', fontsize=14)
-plt.gca().invert_yaxis()  # Invert y-axis for consistency
-plt.tight_layout()
-plt.savefig("./top_10_most_common_skills.png", dpi=150, bbox_inches='tight')
-plt.close()
-
-print("All graphs have been generated successfully!")
+if __name__ == "__main__":
+    args = parse_args()
+    render_figures(args.only or list(FIGURES), prepare_frames(), args.jobs)
+    print("All graphs have been generated successfully!")
@@ -0,0 +1,315 @@
+# %%
+import argparse
+import glob
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+import cleaned_data
+import data_cleaning
+import salary_cube
+import salary_normalization
+
+# %%
+STORE_DIR = "./cleaned_store"
+# columns identifying a posting, a posting seen in an earlier batch is skipped
+IDENTITY_COLUMNS = ["company", "job_title", "location", "post_date", "salary"]
+# average number of identity hashes per bucket file before the buckets are split in two
+IDENTITY_BUCKET_SIZE = 1 << 16
+NORMALIZATION_GROUP = "country_code"
+
+
+def parts_dir(store_dir=STORE_DIR):
+    return os.path.join(store_dir, "parts")
+
+
+def part_path(store_dir, batch_number):
+    return os.path.join(parts_dir(store_dir), f"batch-{batch_number:05d}.parquet")
+
+
+def identities_dir(store_dir=STORE_DIR):
+    return os.path.join(store_dir, "identities")
+
+
+def identity_meta_path(store_dir=STORE_DIR):
+    return os.path.join(identities_dir(store_dir), "meta.json")
+
+
+def bucket_path(store_dir, bits, bucket):
+    return os.path.join(identities_dir(store_dir), str(bits), f"{bucket:x}.u64")
+
+
+def aggregates_path(store_dir, batch_number):
+    return os.path.join(store_dir, f"salary_aggregates-{batch_number:05d}.parquet")
+
+
+def journal_path(store_dir=STORE_DIR):
+    return os.path.join(store_dir, "_pending.json")
+
+
+# %%
+def posting_identities(data):
+    """
+    64 bit hash of IDENTITY_COLUMNS of every cleaned posting.
+    """
+    return pd.util.hash_pandas_object(data[IDENTITY_COLUMNS], index=False).to_numpy()
+
+
+# identity hashes are kept sorted in bucket files by their top bits, a batch looks its hashes up
+# with searchsorted on memory maps of the buckets they fall in and merges new hashes into them.
+# The number of buckets doubles with the store, so a touched bucket holds about
+# IDENTITY_BUCKET_SIZE hashes and a batch costs the same however many batches came before.
+def load_identity_meta(store_dir=STORE_DIR):
+    """
+    Bits of the hash selecting the bucket and number of hashes in the store.
+    """
+    if not os.path.exists(identity_meta_path(store_dir)):
+        return {"bits": 0, "count": 0}
+    with open(identity_meta_path(store_dir)) as f:
+        return json.load(f)
+
+
+def save_identity_meta(store_dir, meta):
+    os.makedirs(identities_dir(store_dir), exist_ok=True)
+    tmp_path = identity_meta_path(store_dir) + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, identity_meta_path(store_dir))
+
+
+def identity_buckets(identities, bits):
+    if not bits:
+        return np.zeros(len(identities), dtype=np.int64)
+    return (identities >> np.uint64(64 - bits)).astype(np.int64)
+
+
+def split_by_bucket(identities, bits):
+    """
+    Yield (bucket, positions of its identities) of every bucket present in identities.
+    """
+    buckets = identity_buckets(identities, bits)
+    order = np.argsort(buckets, kind="stable")
+    buckets = buckets[order]
+    bounds = np.flatnonzero(np.diff(buckets, prepend=-1, append=-1))
+    for start, stop in zip(bounds[:-1], bounds[1:]):
+        yield int(buckets[start]), order[start:stop]
+
+
+def load_bucket(path):
+    """
+    Sorted hashes of a bucket file, memory mapped so only the pages searchsorted visits are read.
+    """
+    if not os.path.exists(path) or not os.path.getsize(path):
+        return np.array([], dtype=np.uint64)
+    return np.memmap(path, dtype=np.uint64, mode="r")
+
+
+def is_known(identities, store_dir, bits, loaded):
+    """
+    Mask of identities already in the store, bucket files are mapped once and kept in dict loaded.
+    """
+    known = np.zeros(len(identities), dtype=bool)
+    for bucket, positions in split_by_bucket(identities, bits):
+        if bucket not in loaded:
+            loaded[bucket] = load_bucket(bucket_path(store_dir, bits, bucket))
+        stored = loaded[bucket]
+        if len(stored):
+            found = np.searchsorted(stored, identities[positions]).clip(max=len(stored) - 1)
+            known[positions] = stored[found] == identities[positions]
+    return known
+
+
+def merge_identities(identities, store_dir, bits):
+    """
+    Write every bucket merged with its new identities next to it as .new file, finish renames them over the buckets.
+    """
+    os.makedirs(os.path.dirname(bucket_path(store_dir, bits, 0)), exist_ok=True)
+    for bucket, positions in split_by_bucket(identities, bits):
+        path = bucket_path(store_dir, bits, bucket)
+        stored = load_bucket(path)
+        new = np.sort(identities[positions])
+        np.insert(stored, np.searchsorted(stored, new), new).tofile(path + ".new")
+
+
+def split_buckets(store_dir, meta):
+    """
+    Double the number of buckets until they hold at most IDENTITY_BUCKET_SIZE hashes on average.
+
+    A sorted bucket splits into contiguous runs, the new level is written next to the old one
+    and takes over when the meta file is replaced. Returns the meta of the store.
+    """
+    bits = meta["bits"]
+    while meta["count"] > IDENTITY_BUCKET_SIZE << bits:
+        bits += 1
+    if bits == meta["bits"]:
+        return meta
+    old_dir = os.path.join(identities_dir(store_dir), str(meta["bits"]))
+    os.makedirs(os.path.join(identities_dir(store_dir), str(bits)), exist_ok=True)
+    shift = bits - meta["bits"]
+    for name in os.listdir(old_dir) if os.path.isdir(old_dir) else []:
+        stored = load_bucket(os.path.join(old_dir, name))
+        for bucket, positions in split_by_bucket(stored, bits):
+            # positions of a sorted bucket are contiguous runs
+            stored[positions[0]:positions[-1] + 1].tofile(bucket_path(store_dir, bits, bucket))
+    meta = {"bits": bits, "count": meta["count"]}
+    save_identity_meta(store_dir, meta)
+    shutil.rmtree(old_dir, ignore_errors=True)
+    return meta
+
+
+def load_aggregates(store_dir=STORE_DIR):
+    """
+    Per country salary_cube cells of all postings in the store, None for an empty store.
+
+    Aggregates of a batch whose part wasn't committed are skipped.
+    """
+    paths = [
+        path for path in sorted(glob.glob(os.path.join(store_dir, "salary_aggregates-*.parquet")))
+        if os.path.exists(part_path(store_dir, int(path[-13:-8])))
+    ]
+    return salary_cube.load_cube(paths[-1]) if paths else None
+
+
+# %%
+# a batch is committed by renaming its part into the parts directory. Merged identity buckets
+# and aggregates are written before that, the journal lists them so the next ingest
+# rolls an interrupted batch back, or finishes it if its part was committed
+def write_journal(store_dir, batch_number, identities, meta):
+    pending = {
+        "batch": batch_number,
+        "buckets": [bucket_path(store_dir, meta["bits"], bucket) for bucket, _ in split_by_bucket(identities, meta["bits"])],
+        "meta": {"bits": meta["bits"], "count": meta["count"] + len(identities)},
+    }
+    tmp_path = journal_path(store_dir) + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(pending, f)
+    os.replace(tmp_path, journal_path(store_dir))
+
+
+def finish(store_dir):
+    """
+    Complete a committed batch: merged buckets replace the old ones, the hash count is updated
+    and aggregates of earlier batches and the journal are removed. Safe to repeat.
+    """
+    with open(journal_path(store_dir)) as f:
+        pending = json.load(f)
+    for path in pending["buckets"]:
+        if os.path.exists(path + ".new"):
+            os.replace(path + ".new", path)
+    save_identity_meta(store_dir, pending["meta"])
+    for path in sorted(glob.glob(os.path.join(store_dir, "salary_aggregates-*.parquet")))[:-1]:
+        os.remove(path)
+    os.remove(journal_path(store_dir))
+
+
+def recover(store_dir=STORE_DIR):
+    """
+    Roll back merged buckets and aggregates of a batch whose part wasn't committed, finish a committed one.
+    """
+    if os.path.exists(journal_path(store_dir)):
+        with open(journal_path(store_dir)) as f:
+            pending = json.load(f)
+        if os.path.exists(part_path(store_dir, pending["batch"])):
+            finish(store_dir)
+        else:
+            for path in pending["buckets"]:
+                if os.path.exists(path + ".new"):
+                    os.remove(path + ".new")
+            if os.path.exists(aggregates_path(store_dir, pending["batch"])):
+                os.remove(aggregates_path(store_dir, pending["batch"]))
+            os.remove(journal_path(store_dir))
+    # levels left over by an interrupted split_buckets
+    bits = str(load_identity_meta(store_dir)["bits"])
+    if os.path.isdir(identities_dir(store_dir)):
+        for name in os.listdir(identities_dir(store_dir)):
+            if name.isdigit() and name != bits:
+                shutil.rmtree(os.path.join(identities_dir(store_dir), name))
+
+
+# %%
+def ingest(batch_path, store_dir=STORE_DIR, reference=data_cleaning.REFERENCE_DATE, chunksize=None):
+    """
+    Clean a batch of raw postings and append postings not seen before to the store.
+
+    Only the batch is cleaned, known postings are looked up with searchsorted in the sorted identity buckets
+    of the batch's hashes, new hashes are merged into them and per country salary aggregates of a fixed size
+    are merged, so ingest time depends on the batch size. Every batch becomes a new Parquet file
+    in the parts directory of the store.
+
+    Returns number of new postings.
+    """
+    os.makedirs(parts_dir(store_dir), exist_ok=True)
+    recover(store_dir)
+    meta = split_buckets(store_dir, load_identity_meta(store_dir))
+    batch_number = len(glob.glob(os.path.join(parts_dir(store_dir), "batch-*.parquet"))) + 1
+    # files starting with _ are skipped when the parts directory is read as a dataset
+    tmp_path = os.path.join(parts_dir(store_dir), f"_batch-{batch_number:05d}.parquet")
+    dimensions = [NORMALIZATION_GROUP]
+    loaded = {}
+    new_identities = []
+    cells = []
+    with cleaned_data.parquet_writer(tmp_path) as writer:
+        for chunk in data_cleaning.read_raw(batch_path, chunksize):
+            chunk, _ = data_cleaning.clean(chunk, reference)
+            identities = posting_identities(chunk)
+            new = ~is_known(identities, store_dir, meta["bits"], loaded) & ~pd.Series(identities).duplicated().to_numpy()
+            if new_identities:
+                new &= ~np.isin(identities, np.concatenate(new_identities))
+            chunk = chunk.loc[new]
+            new_identities.append(identities[new])
+            writer.write_table(cleaned_data.to_arrow(chunk))
+            cells.append(salary_cube.base_cells(chunk, dimensions))
+
+    new_identities = np.concatenate(new_identities)
+    if not len(new_identities):
+        os.remove(tmp_path)
+        return 0
+    previous = load_aggregates(store_dir)
+    if previous is not None:
+        cells.append(previous)
+    write_journal(store_dir, batch_number, new_identities, meta)
+    merge_identities(new_identities, store_dir, meta["bits"])
+    salary_cube.save_cube(
+        salary_cube.roll_up(pd.concat(cells, ignore_index=True), dimensions, dimensions),
+        aggregates_path(store_dir, batch_number),
+    )
+    os.replace(tmp_path, part_path(store_dir, batch_number))
+    finish(store_dir)
+    return len(new_identities)
+
+
+# %%
+def load_store(store_dir=STORE_DIR, columns=None):
+    """
+    Load all ingested postings with the same dtypes as cleaned_data.load_cleaned.
+    """
+    return cleaned_data.load_cleaned(parquet_path=parts_dir(store_dir), csv_path=None, columns=columns)
+
+
+def store_group_stats(store_dir=STORE_DIR):
+    """
+    IQR bounds, mean and std of every country from the running salary aggregates,
+    pass them to salary_normalization.normalize_with_stats.
+    """
+    return salary_normalization.group_stats_from_aggregates(load_aggregates(store_dir), NORMALIZATION_GROUP)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Append a batch of raw postings to the cleaned store")
+    parser.add_argument("batch", help="raw batch, csv or zipped csv with the raw dataset columns")
+    parser.add_argument("--store", default=STORE_DIR, help="directory of the cleaned store")
+    parser.add_argument(
+        "--reference-date", default=data_cleaning.REFERENCE_DATE,
+        help="date the batch was collected on, relative post dates are anchored there",
+    )
+    parser.add_argument("--chunksize", type=int, default=None, help="clean the batch in chunks of this many rows")
+    return parser.parse_args(argv)
+
+# %%
+if __name__ == "__main__":
+    args = parse_args()
+    added = ingest(args.batch, args.store, args.reference_date, args.chunksize)
+    print(f"Added {added} new postings to {args.store}")
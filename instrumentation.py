@@ -0,0 +1,104 @@
+# %%
+import contextlib
+import cProfile
+import itertools
+import json
+import os
+import resource
+import threading
+import time
+
+# %%
+# set PIPELINE_TRACE to record every stage: a .json file is written as Chrome trace
+# (open in chrome://tracing or ui.perfetto.dev), any other file gets JSON lines
+TRACE_PATH = os.environ.get("PIPELINE_TRACE")
+# set PIPELINE_PROFILE_DIR to dump cProfile stats of every stage there, open them with pstats or snakeviz
+PROFILE_DIR = os.environ.get("PIPELINE_PROFILE_DIR")
+ENABLED = bool(TRACE_PATH or PROFILE_DIR)
+
+# a run starts a new trace, worker processes inherit the variable and append to it
+if TRACE_PATH and os.environ.get("PIPELINE_TRACE_RUN") is None:
+    os.environ["PIPELINE_TRACE_RUN"] = str(os.getpid())
+    open(TRACE_PATH, "w").close()
+
+profiling = threading.local()
+profile_numbers = itertools.count()
+
+
+# %%
+def current_rss():
+    """
+    Resident set size of the process in bytes, peak RSS where /proc is not available.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def emit(record):
+    if not TRACE_PATH:
+        return
+    if TRACE_PATH.endswith(".json"):
+        # JSON array trace format doesn't need the closing bracket, so processes can append events
+        event = {
+            "name": record["stage"], "ph": "X", "pid": record["pid"], "tid": threading.get_ident(),
+            "ts": record["start"] * 1e6, "dur": record["seconds"] * 1e6,
+            "args": {key: value for key, value in record.items() if key not in ("stage", "pid", "start", "seconds")},
+        }
+        line = ("[\n" if os.path.getsize(TRACE_PATH) == 0 else "") + json.dumps(event) + ",\n"
+    else:
+        line = json.dumps(record) + "\n"
+    with open(TRACE_PATH, "a") as f:
+        f.write(line)
+
+
+@contextlib.contextmanager
+def record_stage(name, rows_in):
+    record = {"stage": name, "pid": os.getpid(), "rows_in": rows_in, "rows_out": None}
+    # nested stages are covered by the profile of the outermost one
+    profiler = None
+    if PROFILE_DIR and not getattr(profiling, "active", False):
+        profiler = cProfile.Profile()
+        profiling.active = True
+        profiler.enable()
+    rss = current_rss()
+    record["start"] = time.time()
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record["seconds"] = time.perf_counter() - start
+        record["memory_delta_mb"] = (current_rss() - rss) / 2 ** 20
+        if profiler is not None:
+            profiler.disable()
+            profiling.active = False
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            record["profile"] = os.path.join(PROFILE_DIR, f"{name}-{os.getpid()}-{next(profile_numbers)}.prof")
+            profiler.dump_stats(record["profile"])
+        emit(record)
+
+
+def stage(name, rows_in=None):
+    """
+    Context manager recording wall time, rows and memory delta of a pipeline stage.
+
+    Yields a dict, set its rows_out to the number of rows the stage produced.
+    Does nothing unless PIPELINE_TRACE or PIPELINE_PROFILE_DIR is set.
+    """
+    if not ENABLED:
+        return contextlib.nullcontext({})
+    return record_stage(name, rows_in)
+
+
+def run_stage(name, func, data, *args, **kwargs):
+    """
+    func(data, *args, **kwargs) recorded as a stage, rows are counted on the DataFrames in and out.
+    """
+    if not ENABLED:
+        return func(data, *args, **kwargs)
+    with record_stage(name, len(data)) as record:
+        result = func(data, *args, **kwargs)
+        record["rows_out"] = len(result)
+    return result
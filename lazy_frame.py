@@ -0,0 +1,117 @@
+# %%
+import duckdb
+
+from cleaned_data import CATEGORICAL_COLUMNS, cleaned_data_path, compact_dtypes, sorted_categories
+from salary_normalization import IQR_FACTOR, IQR_MIN_GROUP_SIZE
+
+# %%
+# plans are DuckDB relations: every step only extends the query, nothing is read
+# until collect, and the optimizer pushes column selection and filters down into the file scan
+ROW_ID = "row_id"
+
+
+def scan(path=None, columns=None, where=None, con=None):
+    """
+    Plan reading the cleaned dataset, Parquet file if it exists, csv otherwise.
+
+    Args:
+        path: cleaned dataset, cleaned_data_path() by default
+        columns: columns to read, all by default
+        where: SQL condition rows have to match, e.g. "status = 'remote'"
+        con: DuckDB connection, a new in-memory one by default
+
+    Rows carry row_id, their position in the file, which is the index
+    of collected frames so they line up with rows of the skill index.
+    """
+    con = con or duckdb.connect()
+    path = path or cleaned_data_path()
+    if path.endswith(".parquet"):
+        rel = con.sql(f"SELECT * EXCLUDE (file_row_number), file_row_number AS {ROW_ID} "
+                      f"FROM read_parquet('{path}', file_row_number = true)")
+    else:
+        rel = con.sql(f"SELECT *, row_number() OVER () - 1 AS {ROW_ID} FROM read_csv_auto('{path}')")
+    if where:
+        rel = rel.filter(where)
+    if columns:
+        rel = rel.project(", ".join(list(columns) + [ROW_ID]))
+    return rel
+
+
+def filter_and_normalize(rel, by="country_code", column="salary_avg"):
+    """
+    Plans of salary_normalization.filter_and_normalize: IQR filter by group and Z score
+    within the kept and within all rows of the group, rows with missing group keys are dropped.
+
+    Returns (filtered, unfiltered) plans with salary_avg_normalized column.
+    """
+    by = [by] if isinstance(by, str) else list(by)
+    window = f"OVER (PARTITION BY {', '.join(by)})"
+    valid = rel.filter(" AND ".join(f"{col} IS NOT NULL" for col in by))
+    bounds = valid.project(
+        f"*, count(*) {window} AS _size, "
+        f"quantile_cont({column}, 0.25) {window} AS _q1, quantile_cont({column}, 0.75) {window} AS _q3"
+    )
+    iqr = "(_q3 - _q1)"
+    kept = bounds.filter(
+        f"_size < {IQR_MIN_GROUP_SIZE} "
+        f"OR {column} BETWEEN _q1 - {IQR_FACTOR} * {iqr} AND _q3 + {IQR_FACTOR} * {iqr}"
+    )
+
+    def normalize(plan):
+        std = f"stddev_samp({column}) {window}"
+        return plan.project(
+            f"* EXCLUDE (_size, _q1, _q3), "
+            f"CASE WHEN {std} IS NULL OR {std} = 0 THEN 0 "
+            f"ELSE ({column} - avg({column}) {window}) / {std} END AS salary_avg_normalized"
+        )
+
+    return normalize(kept), normalize(bounds)
+
+
+def aggregate(rel, by, expressions):
+    """
+    Plan of a group by, e.g. aggregate(plan, "industry", "median(salary_avg_normalized) AS median"),
+    rows with missing keys are left out like groupby does.
+    """
+    by = [by] if isinstance(by, str) else list(by)
+    present = rel.filter(" AND ".join(f"{col} IS NOT NULL" for col in by))
+    return present.aggregate(f"{', '.join(by)}, {expressions}", ", ".join(by))
+
+
+def materialize(rel, name, con):
+    """
+    Run the plan once into table name of connection con, the one its scan was given.
+
+    Returns a plan reading the table, so plans built on it, e.g. several collects and aggregates,
+    don't run the scan, windows and filters again. Meant for in-memory connections.
+    """
+    rel.to_table(name)
+    return con.table(name)
+
+
+def collect(rel, columns=None, compact=True):
+    """
+    Run the plan, returns DataFrame with the categorical and compact dtypes of cleaned_data.load_cleaned.
+
+    Rows of plans with row_id are returned in file order indexed by it.
+    skills are lists from the Parquet file but raw list literals from the csv, parse those
+    with cleaned_data.parse_skills.
+    """
+    if columns:
+        rel = rel.project(", ".join(list(columns) + ([ROW_ID] if ROW_ID in rel.columns else [])))
+    if ROW_ID in rel.columns:
+        df = rel.order(ROW_ID).df().set_index(ROW_ID)
+        df.index.name = None
+    else:
+        df = rel.df()
+    for col in CATEGORICAL_COLUMNS:
+        if col in df:
+            df[col] = sorted_categories(df[col])
+    return compact_dtypes(df) if compact else df
+
+
+def explain(rel):
+    """
+    Optimized plan, shows which columns and filters are pushed into the scan.
+    """
+    return rel.explain()
@@ -0,0 +1,116 @@
+# %%
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from cleaned_data import cleaned_data_path, load_cleaned
+
+# %%
+# GROUP BY questions of questions.sql: number -> (dimension, metric, order of the result)
+QUESTIONS = {
+    1: ("job_title", "count", None),
+    2: ("seniority_level", "count", None),
+    4: ("job_title", "mean", None),
+    5: ("seniority_level", "mean", None),
+    6: ("industry", "count", None),
+    7: ("industry", "mean", "desc"),
+    8: ("country_code", "mean", "desc"),
+    9: ("status", "count", "desc"),
+    10: ("status", "mean", "desc"),
+}
+METRIC_COLUMNS = {"count": "job_count", "mean": "average_salary"}
+VALUE_COLUMN = "salary_avg"
+
+
+# %%
+def new_state(dimensions):
+    """
+    Empty running aggregates: for every dimension a table of group keys
+    and arrays of row count, non missing value count and value sum per group.
+    """
+    return {
+        dim: {"keys": {}, "count": np.zeros(0, np.int64), "values": np.zeros(0, np.int64), "sum": np.zeros(0)}
+        for dim in dimensions
+    }
+
+
+def update(state, chunk, value=VALUE_COLUMN):
+    """
+    Add a chunk of rows to every dimension's aggregates reading the value column once.
+
+    Group keys are dictionary encoded by factorize (categoricals reuse their codes),
+    only the distinct keys of the chunk are looked up in the shared key table.
+    """
+    values = chunk[value].to_numpy(dtype=float)
+    present = ~np.isnan(values)
+    values = np.where(present, values, 0.0)
+    for dim, acc in state.items():
+        codes, uniques = pd.factorize(chunk[dim], use_na_sentinel=False)
+        # missing keys form their own group like NULL in GROUP BY
+        ids = np.array(
+            [acc["keys"].setdefault(None if pd.isna(key) else key, len(acc["keys"])) for key in uniques],
+            dtype=np.int64,
+        )
+        rows = ids[codes]
+        size = len(acc["keys"])
+        for name, weights in (("count", None), ("values", present), ("sum", values)):
+            grown = np.zeros(size, acc[name].dtype)
+            grown[: len(acc[name])] = acc[name]
+            grown += np.bincount(rows, weights=weights, minlength=size).astype(acc[name].dtype)
+            acc[name] = grown
+    return state
+
+
+def group_table(acc, dim):
+    keys = list(acc["keys"])
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.where(acc["values"] > 0, acc["sum"] / acc["values"], np.nan)
+    return pd.DataFrame({dim: keys, "count": acc["count"], "sum": acc["sum"], "mean": mean})
+
+
+def answer_questions(state, questions=QUESTIONS):
+    """
+    Result table of every question from the aggregates, same columns as in questions.sql.
+    """
+    answers = {}
+    for number, (dim, metric, order) in questions.items():
+        table = group_table(state[dim], dim)[[dim, metric]].rename(columns={metric: METRIC_COLUMNS[metric]})
+        if order is not None:
+            table = table.sort_values(METRIC_COLUMNS[metric], ascending=order == "asc", ignore_index=True)
+        answers[number] = table
+    return answers
+
+
+def aggregate_all(chunks, questions=QUESTIONS, value=VALUE_COLUMN):
+    """
+    Answer all questions in one scan over chunks (DataFrames) of the cleaned dataset.
+    """
+    state = new_state(sorted({dim for dim, _, _ in questions.values()}))
+    for chunk in chunks:
+        update(state, chunk, value)
+    return answer_questions(state, questions)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Answer GROUP BY questions of questions.sql in one scan")
+    parser.add_argument("--data", default=None, help="cleaned dataset, Parquet or csv")
+    parser.add_argument("--rows", type=int, default=10, help="number of result rows to show")
+    return parser.parse_args(argv)
+
+# %%
+if __name__ == "__main__":
+    args = parse_args()
+    path = args.data or cleaned_data_path()
+    columns = sorted({dim for dim, _, _ in QUESTIONS.values()} | {VALUE_COLUMN})
+    if path.endswith(".parquet"):
+        df = load_cleaned(parquet_path=path, columns=columns)
+    else:
+        df = load_cleaned(parquet_path="", csv_path=path, columns=columns)
+    start = time.perf_counter()
+    answers = aggregate_all([df])
+    print(f"Answered {len(answers)} questions in {(time.perf_counter() - start) * 1000:.2f} ms")
+    for number, table in answers.items():
+        print(f"\n-- {number}.")
+        print(table.head(args.rows).to_string(index=False))
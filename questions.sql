@@ -20,27 +20,38 @@ FROM
 GROUP BY
   seniority_level;
 
--- 3. Apply IQR method to find outliers in the salary_usd field
-
+-- 3. Apply IQR method to find outliers in the salary_avg field
+-- quartiles are computed per country like iqr_filter in the analysis scripts does,
+-- once per country into a small stats table joined to the rows,
+-- countries with less than 4 jobs have no outliers, jobs without a country are left out
+
+WITH stats AS (
+  SELECT
+    country_code,
+    COUNT(*) AS job_count,
+    PERCENTILE_CONT(0.25) WITHIN GROUP (ORDER BY salary_avg) AS Q1,
+    PERCENTILE_CONT(0.75) WITHIN GROUP (ORDER BY salary_avg) AS Q3
+  FROM
+    jobs
+  WHERE
+    country_code IS NOT NULL
+  GROUP BY
+    country_code
+)
 SELECT
-  salary_avg,
+  jobs.country_code,
+  jobs.salary_avg,
   CASE
+    WHEN stats.job_count < 4 THEN FALSE
     WHEN
-      salary_avg < (Q1 - 1.5 * IQR) OR salary_avg > (Q3 + 1.5 * IQR)
-      THEN TRUE
-    ELSE FALSE
+      jobs.salary_avg BETWEEN stats.Q1 - 1.5 * (stats.Q3 - stats.Q1) AND stats.Q3 + 1.5 * (stats.Q3 - stats.Q1)
+      THEN FALSE
+    ELSE TRUE
   END AS outlier_status
-  FROM
-    (
-      SELECT
-        salary_avg,
-        PERCENTILE_CONT(0.25) WITHIN GROUP (ORDER BY salary_avg) AS Q1,
-        PERCENTILE_CONT(0.75) WITHIN GROUP (ORDER BY salary_avg) AS Q3,
-        (PERCENTILE_CONT(0.75) WITHIN GROUP (ORDER BY salary_avg) - PERCENTILE_CONT(0.25) WITHIN GROUP (ORDER BY salary_avg)) AS IQR
-      FROM
-        jobs
-    ) AS stats;
-  
+FROM
+  jobs
+  JOIN stats ON jobs.country_code = stats.country_code;
+
 -- 4. Average salary per job title
 
 SELECT
@@ -118,3 +129,25 @@ GROUP BY
   status
 ORDER BY
   average_salary DESC;
+
+-- 11. Counts and average salaries of queries 1, 2 and 4-10 in a single scan
+
+SELECT
+  CASE
+    WHEN GROUPING(country_code) = 0 THEN 'country_code'
+    WHEN GROUPING(industry) = 0 THEN 'industry'
+    WHEN GROUPING(job_title) = 0 THEN 'job_title'
+    WHEN GROUPING(seniority_level) = 0 THEN 'seniority_level'
+    WHEN GROUPING(status) = 0 THEN 'status'
+  END AS dimension,
+  country_code,
+  industry,
+  job_title,
+  seniority_level,
+  status,
+  COUNT(*) AS job_count,
+  AVG(salary_avg) AS average_salary
+FROM
+  jobs
+GROUP BY
+  GROUPING SETS ((country_code), (industry), (job_title), (seniority_level), (status));
@@ -0,0 +1,225 @@
+# %%
+import argparse
+import itertools
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import quantile_sketch
+from cleaned_data import load_cleaned
+from salary_normalization import filter_and_normalize
+
+# %%
+CUBE_PATH = "./salary_cube.parquet"
+DIMENSIONS = ["seniority_level", "industry", "status", "country_code", "company_size_band"]
+MEASURE = "salary_avg"
+COMPANY_SIZE_BINS = [0, 50, 200, 1000, 5000, 10000, np.inf]
+COMPANY_SIZE_BANDS = ["1-50", "51-200", "201-1000", "1001-5000", "5001-10000", "10000+"]
+
+
+def add_company_size_band(df):
+    size = df["company_size"].astype("float64")
+    return df.assign(company_size_band=pd.cut(size, COMPANY_SIZE_BINS, labels=COMPANY_SIZE_BANDS))
+
+
+# %%
+# a cube is a DataFrame of cells: grouping is the bit mask of dimensions a cell is grouped by
+# (bit i for DIMENSIONS[i], all bits set for the finest cells), rolled up dimensions are None.
+# Cells hold mergeable aggregates of the measure: row count, count n of non missing values,
+# sum, m2 (sum of squared deviations from the cell mean, merged with Chan's formula
+# so variance doesn't lose precision the way raw sums of squares do), min, max and a quantile sketch.
+def base_cells(df, dimensions=DIMENSIONS, measure=MEASURE, k=quantile_sketch.DEFAULT_K, seed=0):
+    """
+    Aggregates of the measure for every combination of dimension values present in df,
+    missing values of a dimension form their own cell. Sketches are seeded so cubes are reproducible.
+    """
+    if "company_size_band" in dimensions and "company_size_band" not in df:
+        df = add_company_size_band(df)
+    keys = pd.DataFrame({dim: df[dim].astype(object).where(df[dim].notna(), None) for dim in dimensions})
+    codes = keys.groupby(dimensions, dropna=False, sort=False).ngroup().to_numpy()
+    values = df[measure].to_numpy(dtype=float)
+    present = ~np.isnan(values)
+    size = codes.max() + 1 if len(codes) else 0
+    first = pd.Series(np.arange(len(codes))).groupby(codes).first().to_numpy()
+    cells = keys.iloc[first].reset_index(drop=True)
+    cells.insert(0, "grouping", 2 ** len(dimensions) - 1)
+    cells["count"] = np.bincount(codes, minlength=size)
+    cells["n"] = np.bincount(codes[present], minlength=size)
+    cells["sum"] = np.bincount(codes[present], weights=values[present], minlength=size)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = cells["sum"].to_numpy() / cells["n"].to_numpy()
+    cells["m2"] = np.bincount(codes[present], weights=(values[present] - mean[codes[present]]) ** 2, minlength=size)
+    cells["min"] = pd.Series(values).groupby(codes).min().reindex(range(size)).to_numpy()
+    cells["max"] = pd.Series(values).groupby(codes).max().reindex(range(size)).to_numpy()
+    order = np.argsort(codes, kind="stable")
+    bounds = np.searchsorted(codes[order], np.arange(size + 1))
+    cells["sketch"] = [
+        quantile_sketch.update(quantile_sketch.new_sketch(k, seed), values[order[start:stop]])
+        for start, stop in zip(bounds[:-1], bounds[1:])
+    ]
+    return cells
+
+
+def roll_up(cells, by, dimensions=DIMENSIONS):
+    """
+    Merge cells into groups of the by dimensions, other dimensions are rolled up.
+    """
+    by = [dim for dim in dimensions if dim in by]
+    if by:
+        codes = cells.groupby(by, dropna=False, sort=False).ngroup().to_numpy()
+    else:
+        codes = np.zeros(len(cells), dtype=np.int64)
+    size = codes.max() + 1 if len(codes) else 0
+    first = pd.Series(np.arange(len(cells))).groupby(codes).first().to_numpy()
+    groups = pd.DataFrame({dim: cells[dim].to_numpy()[first] if dim in by else [None] * size for dim in dimensions})
+    groups.insert(0, "grouping", sum(2 ** dimensions.index(dim) for dim in by))
+    n = cells["n"].to_numpy(dtype=float)
+    groups["count"] = np.bincount(codes, weights=cells["count"], minlength=size).astype(np.int64)
+    groups["n"] = np.bincount(codes, weights=n, minlength=size).astype(np.int64)
+    groups["sum"] = np.bincount(codes, weights=cells["sum"], minlength=size)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        cell_mean = np.where(n > 0, cells["sum"].to_numpy() / n, 0.0)
+        group_mean = groups["sum"].to_numpy() / groups["n"].to_numpy()
+    spread = np.where(n > 0, n * (cell_mean - group_mean[codes]) ** 2, 0.0)
+    groups["m2"] = np.bincount(codes, weights=cells["m2"].to_numpy() + spread, minlength=size)
+    groups["min"] = cells["min"].groupby(codes).min().to_numpy()
+    groups["max"] = cells["max"].groupby(codes).max().to_numpy()
+    sketches = [None] * size
+    for code, sketch in zip(codes, cells["sketch"]):
+        sketches[code] = sketch if sketches[code] is None else quantile_sketch.merge(sketches[code], sketch)
+    groups["sketch"] = sketches
+    return groups
+
+
+def build_cube(df, dimensions=DIMENSIONS, measure=MEASURE, k=quantile_sketch.DEFAULT_K, seed=0):
+    """
+    Cube with cells of every combination of dimensions (2 ** len(dimensions) groupings),
+    rolled up from the finest cells so the rows are scanned once.
+    """
+    return cube_from_cells(base_cells(df, dimensions, measure, k, seed), dimensions)
+
+
+def cube_from_cells(cells, dimensions=DIMENSIONS):
+    finest = cells[cells["grouping"] == 2 ** len(dimensions) - 1]
+    return pd.concat(
+        [
+            roll_up(finest, list(by), dimensions)
+            for size in range(len(dimensions), -1, -1)
+            for by in itertools.combinations(dimensions, size)
+        ],
+        ignore_index=True,
+    )
+
+
+def merge_cubes(a, b, dimensions=DIMENSIONS):
+    """
+    Cube of the union of rows of cubes a and b, e.g. built from different chunks or batches.
+    """
+    finest = 2 ** len(dimensions) - 1
+    cells = pd.concat([a[a["grouping"] == finest], b[b["grouping"] == finest]], ignore_index=True)
+    return cube_from_cells(roll_up(cells, dimensions, dimensions), dimensions)
+
+
+# %%
+def save_cube(cube, path=CUBE_PATH):
+    """
+    Write cube to Parquet, sketches are stored as their k and lists of items per level.
+    """
+    table = cube.drop(columns="sketch").assign(
+        sketch_k=[sketch["k"] for sketch in cube["sketch"]],
+        sketch_levels=[quantile_sketch.to_levels(sketch) for sketch in cube["sketch"]],
+    )
+    for dim in cube.columns[1:cube.columns.get_loc("count")]:
+        table[dim] = table[dim].astype(object)
+    pq.write_table(pa.Table.from_pandas(table, preserve_index=False), path)
+
+
+def load_cube(path=CUBE_PATH):
+    table = pq.read_table(path).to_pandas()
+    table["sketch"] = [
+        quantile_sketch.from_levels(levels, None if pd.isna(k) else int(k), rows, n)
+        for levels, k, rows, n in zip(table["sketch_levels"], table["sketch_k"], table["count"], table["n"])
+    ]
+    return table.drop(columns=["sketch_k", "sketch_levels"])
+
+
+def query(cube, by=(), where=None, quantiles=(0.5,), dropna=True, dimensions=DIMENSIONS):
+    """
+    Statistics of the measure by the by dimensions over cells matching where.
+
+    Args:
+        cube: cube from build_cube or load_cube
+        by: dimensions to group by
+        where: dict dimension -> value or list of values to keep
+        quantiles: quantiles to estimate from the sketches
+        dropna: leave out groups with missing by values like groupby does
+
+    Returns DataFrame indexed by the by dimensions with count (rows), n (non missing values),
+    mean, std (sample), min, max and q<quantile> columns.
+    """
+    where = where or {}
+    by = list(by)
+    needed = set(by) | set(where)
+    cells = cube[cube["grouping"] == sum(2 ** dimensions.index(dim) for dim in needed)]
+    for dim, value in where.items():
+        values = value if isinstance(value, (list, tuple, set)) else [value]
+        cells = cells[cells[dim].isin(values)]
+    if dropna and by:
+        cells = cells[cells[by].notna().all(axis=1)]
+    if set(where) - set(by):
+        cells = roll_up(cells, by, dimensions)
+    n = cells["n"].to_numpy(dtype=float)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        result = pd.DataFrame({
+            "count": cells["count"].to_numpy(),
+            "n": cells["n"].to_numpy(),
+            "mean": cells["sum"].to_numpy() / n,
+            "std": np.sqrt(cells["m2"].to_numpy() / (n - 1)),
+            "min": cells["min"].to_numpy(),
+            "max": cells["max"].to_numpy(),
+        })
+    result["std"] = result["std"].where(n > 1)
+    for q in quantiles:
+        result[f"q{q:g}"] = [quantile_sketch.quantile(sketch, q) for sketch in cells["sketch"]]
+    if by:
+        result.index = pd.MultiIndex.from_frame(cells[by]) if len(by) > 1 else pd.Index(cells[by[0]], name=by[0])
+    return result
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Build or query the salary cube")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="build the cube from the cleaned dataset")
+    build.add_argument("--output", default=CUBE_PATH)
+    build.add_argument(
+        "--measure", default=MEASURE,
+        help="column to aggregate, salary_avg_normalized is the Z score by country of unfiltered rows",
+    )
+    build.add_argument("--k", type=int, default=quantile_sketch.DEFAULT_K, help="size of quantile sketches")
+    ask = commands.add_parser("query", help="aggregate the cube")
+    ask.add_argument("--cube", default=CUBE_PATH)
+    ask.add_argument("--by", nargs="*", default=[], choices=DIMENSIONS)
+    ask.add_argument("--where", nargs="*", default=[], help="filters as dimension=value")
+    ask.add_argument("--quantiles", nargs="*", type=float, default=[0.5])
+    return parser.parse_args(argv)
+
+# %%
+if __name__ == "__main__":
+    args = parse_args()
+    if args.command == "build":
+        df = load_cleaned()
+        if args.measure == "salary_avg_normalized":
+            df = filter_and_normalize(df, "country_code")[1]
+        cube = build_cube(df, measure=args.measure, k=args.k)
+        save_cube(cube, args.output)
+        print(f"{len(cube)} cells written to {args.output}")
+    else:
+        cube = load_cube(args.cube)
+        where = dict(condition.split("=", 1) for condition in args.where)
+        start = time.perf_counter()
+        result = query(cube, args.by, where, args.quantiles)
+        print(result.to_string())
+        print(f"{(time.perf_counter() - start) * 1000:.2f} ms")
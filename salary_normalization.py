@@ -0,0 +1,221 @@
+# %%
+import numpy as np
+import pandas as pd
+
+import quantile_sketch
+from quantile_sketch import weighted_quantile
+
+# %%
+# groups smaller than this are kept as they are by the IQR filter
+IQR_MIN_GROUP_SIZE = 4
+IQR_FACTOR = 1.5
+
+
+# %%
+def group_codes(df, by="country_code"):
+    """
+    Number of the group of every row, NaN for rows with missing group keys
+    which are left out like groupby does.
+
+    Args:
+        df: DataFrame with job data
+        by: column or list of columns to group by, e.g. ["country_code", "seniority_level", "job_title"]
+    """
+    return df.groupby(by, observed=True, sort=False).ngroup().where(lambda codes: codes >= 0)
+
+
+def iqr_bounds(grouped):
+    """
+    Size, quartiles and [Q1 - 1.5 IQR, Q3 + 1.5 IQR] bounds of every group of grouped salary,
+    quartiles are computed once per group.
+    """
+    stats = pd.DataFrame({
+        "size": grouped.size(),
+        "q1": grouped.quantile(0.25),
+        "q3": grouped.quantile(0.75),
+    })
+    iqr = stats["q3"] - stats["q1"]
+    stats["lower"] = stats["q1"] - IQR_FACTOR * iqr
+    stats["upper"] = stats["q3"] + IQR_FACTOR * iqr
+    return stats
+
+
+def sketch_iqr_bounds(sketches, by="country_code"):
+    """
+    iqr_bounds of groups from quantile_sketch sketches, e.g. merged from chunks or processes,
+    quartiles are within quantile_sketch.rank_error of the exact ones.
+    """
+    stats = pd.DataFrame({
+        "size": quantile_sketch.grouped_rows(sketches, by),
+        "q1": quantile_sketch.grouped_quantile(sketches, 0.25, by),
+        "q3": quantile_sketch.grouped_quantile(sketches, 0.75, by),
+    })
+    iqr = stats["q3"] - stats["q1"]
+    stats["lower"] = stats["q1"] - IQR_FACTOR * iqr
+    stats["upper"] = stats["q3"] + IQR_FACTOR * iqr
+    return stats
+
+
+def within_bounds(salary, row_stats):
+    """
+    Rows kept by IQR filter given statistics of the group of every row.
+
+    Groups with less than 4 rows are kept entirely, rows without a group are dropped.
+    """
+    small = row_stats["size"] < IQR_MIN_GROUP_SIZE
+    within = salary.between(row_stats["lower"], row_stats["upper"])
+    return row_stats["size"].notna() & (small | within)
+
+
+def iqr_keep_mask(salary, codes):
+    """
+    Boolean mask of rows within [Q1 - 1.5 IQR, Q3 + 1.5 IQR] of their group.
+    """
+    stats = iqr_bounds(salary.groupby(codes))
+    return within_bounds(salary, stats.reindex(codes.to_numpy()).set_axis(salary.index))
+
+
+def zscore(salary, codes):
+    """
+    Z score of salary within its group, 0 where group std is 0 or undefined (single row groups).
+
+    Missing salaries are skipped when computing group mean and std.
+    """
+    grouped = salary.groupby(codes)
+    mean = grouped.transform("mean")
+    std = grouped.transform("std")
+    return ((salary - mean) / std).where((std != 0) & std.notna(), 0.0)
+
+
+def iqr_group_stats(df, by="country_code", column="salary_avg"):
+    """
+    IQR statistics table with a row per group, see iqr_bounds.
+    """
+    df = df.assign(**{column: df[column].astype("float64")})
+    return iqr_bounds(df.groupby(by, observed=True)[column])
+
+
+def join_group_stats(df, stats, by="country_code"):
+    """
+    Statistics of the group of every row of df, NaN for rows without a group in stats.
+    """
+    by = [by] if isinstance(by, str) else list(by)
+    return df[by].merge(stats, left_on=by, right_index=True, how="left").set_index(df.index)
+
+
+def flag_outliers(df, by="country_code", column="salary_avg", stats=None):
+    """
+    Python counterpart of query 3 in questions.sql: True for rows iqr filter removes.
+
+    Quartiles are computed once per group into a small table (or taken from stats,
+    e.g. iqr_group_stats of a larger dataset) and joined to the rows.
+    Rows without a group are <NA>.
+    """
+    stats = iqr_group_stats(df, by, column) if stats is None else stats
+    row_stats = join_group_stats(df, stats, by)
+    outlier = ~within_bounds(df[column].astype("float64"), row_stats)
+    return outlier.astype("boolean").mask(row_stats["size"].isna())
+
+
+def filter_and_normalize(df, by="country_code", column="salary_avg", sketch_k=None):
+    """
+    Filter outliers with IQR and normalize salary with Z score by group in one vectorized pass.
+
+    Args:
+        df: DataFrame with job data
+        by: column or list of columns to group by
+        column: salary column to filter and normalize
+        sketch_k: take quartiles from KLL sketches of this size instead of sorting every group,
+            None for exact quartiles
+
+    Returns (filtered, unfiltered) frames with salary_avg_normalized column,
+    normalized within the filtered and the whole groups respectively.
+    Rows keep their order and index, rows with missing group keys are dropped.
+    """
+    codes = group_codes(df, by)
+    # salaries may be stored as float32, statistics are computed in float64
+    salary = df[column].astype("float64")
+    if sketch_k is None:
+        keep = iqr_keep_mask(salary, codes)
+    else:
+        stats = sketch_iqr_bounds(quantile_sketch.grouped_sketches(df, by, column, sketch_k), by)
+        keep = within_bounds(salary, join_group_stats(df, stats, by))
+    valid = codes.notna()
+    # filtered rows are normalized with statistics of the kept rows only
+    filtered = df.loc[keep].assign(salary_avg_normalized=zscore(salary.where(keep), codes)[keep])
+    unfiltered = df.loc[valid].assign(salary_avg_normalized=zscore(salary, codes)[valid])
+    return filtered, unfiltered
+
+
+# %%
+# running aggregates: n, sum, m2 (squared deviations from the mean) and a quantile sketch of salary
+# by group, e.g. salary_cube cells, are mergeable across batches and keep a fixed size
+# however many rows were ingested
+def weighted_mean_std(values, counts):
+    n = counts.sum()
+    if not n:
+        return np.nan, np.nan
+    mean = (values * counts).sum() / n
+    std = np.sqrt((counts * (values - mean) ** 2).sum() / (n - 1)) if n > 1 else np.nan
+    return mean, std
+
+
+def group_stats_from_aggregates(cells, by="country_code"):
+    """
+    Statistics filter_and_normalize needs for every group computed from running aggregates.
+
+    Args:
+        cells: DataFrame with a row per group, the by columns, n, sum, m2 and sketch
+        by: column or list of columns the cells are grouped by, rows with a missing key are left out
+
+    Returns DataFrame indexed by group with size, lower and upper IQR bounds,
+    mean and std of all rows and filtered_mean and filtered_std of rows within bounds.
+    Mean and std are exact, bounds and filtered statistics are taken from the sketch items,
+    exact until a group outgrows the sketch's k and within quantile_sketch.rank_error after.
+    """
+    by = [by] if isinstance(by, str) else list(by)
+    cells = cells[cells[by].notna().all(axis=1) & (cells["n"] > 0)]
+
+    def stats(cell):
+        size = cell.n
+        values, weights = quantile_sketch.weighted_items(cell.sketch)
+        lower, upper = -np.inf, np.inf
+        if size >= IQR_MIN_GROUP_SIZE:
+            q1 = weighted_quantile(values, weights, 0.25)
+            q3 = weighted_quantile(values, weights, 0.75)
+            lower, upper = q1 - IQR_FACTOR * (q3 - q1), q3 + IQR_FACTOR * (q3 - q1)
+        within = (values >= lower) & (values <= upper)
+        filtered_mean, filtered_std = weighted_mean_std(values[within], weights[within])
+        return {
+            "size": float(size), "lower": lower, "upper": upper,
+            "mean": cell.sum / size, "std": np.sqrt(cell.m2 / (size - 1)) if size > 1 else np.nan,
+            "filtered_mean": filtered_mean, "filtered_std": filtered_std,
+        }
+
+    index = pd.MultiIndex.from_frame(cells[by]) if len(by) > 1 else pd.Index(cells[by[0]], name=by[0])
+    columns = ["size", "lower", "upper", "mean", "std", "filtered_mean", "filtered_std"]
+    return pd.DataFrame(
+        [stats(cell) for cell in cells.itertuples(index=False)], index=index, columns=columns
+    ).sort_index()
+
+
+def normalize_with_stats(df, stats, by="country_code", column="salary_avg"):
+    """
+    filter_and_normalize with precomputed group statistics, e.g. from running aggregates
+    of all ingested batches, so the whole history doesn't need to be scanned.
+
+    Rows of groups missing in stats are dropped.
+    """
+    row_stats = join_group_stats(df, stats, by)
+    salary = df[column].astype("float64")
+    valid = row_stats["size"].notna()
+    keep = within_bounds(salary, row_stats)
+
+    def scale(mean, std):
+        return ((salary - mean) / std).where((std != 0) & std.notna(), 0.0)
+
+    filtered_z = scale(row_stats["filtered_mean"], row_stats["filtered_std"])
+    unfiltered_z = scale(row_stats["mean"], row_stats["std"])
+    filtered = df.loc[keep].assign(salary_avg_normalized=filtered_z[keep])
+    unfiltered = df.loc[valid].assign(salary_avg_normalized=unfiltered_z[valid])
+    return filtered, unfiltered
@@ -1,118 +1,64 @@
 # %%
-import numpy as np
-import pandas as pd
-import ast  # To safely evaluate string representations of Python literals
-
-# %%
-# Define IQR filtering and normalization functions similar to analysis.py
-def iqr_filter(group):
-    if len(group) < 4:
-        return group
-    Q1 = group["salary_avg"].quantile(0.25)
-    Q3 = group["salary_avg"].quantile(0.75)
-    IQR = Q3 - Q1
-    filtered_group = group[(group["salary_avg"] >= Q1 - 1.5 * IQR) & (group["salary_avg"] <= Q3 + 1.5 * IQR)]
-    return filtered_group
-
-def normalize_salary(group):
-    mean_val = group["salary_avg"].mean()
-    std_val = group["salary_avg"].std()
-    
-    # Handle case where standard deviation is 0 (or very close to 0)
-    if std_val == 0 or pd.isna(std_val):
-        group["salary_avg_normalized"] = 0  # If std is 0, all values are the same, so normalized value is 0
-    else:
-        group["salary_avg_normalized"] = (group["salary_avg"] - mean_val) / std_val
-    return group
-
-# %%
-def calculate_skill_prices(df, use_normalized=False):
-    """
-    Calculate the average salary for each skill by:
-    1. Parsing the skills column (which contains string representations of lists)
-    2. Creating a mapping from each skill to the salaries of jobs requiring that skill
-    3. Calculating the average salary for each skill
-    
-    Args:
-        df: DataFrame with job data
-        use_normalized: Whether to use normalized salary instead of raw salary
-    """
-    # Create a dictionary to store skills and their associated salaries
-    skill_salaries = {}
-    
-    # Determine which salary column to use
-    salary_col = "salary_avg_normalized" if use_normalized else "salary_avg"
-    
-    # Iterate through each row in the dataframe
-    for idx, row in df.iterrows():
-        # Convert the string representation of the list to an actual list
-        try:
-            skills_list = ast.literal_eval(row['skills'])
-            salary_avg = row[salary_col]
-            
-            # For each skill in the list, add the salary to that skill's list
-            if isinstance(skills_list, list) and len(skills_list) > 0:
-                for skill in skills_list:
-                    skill = skill.lower().strip()  # Normalize the skill name
-                    if skill not in skill_salaries:
-                        skill_salaries[skill] = []
-                    skill_salaries[skill].append(salary_avg)
-        except (ValueError, SyntaxError):
-            # If there's an error in parsing the skills, skip this row
-            continue
-    
-    # Calculate the average salary for each skill
-    skill_prices = {}
-    for skill, salaries in skill_salaries.items():
-        skill_prices[skill] = {
-            'average_salary': np.mean(salaries),
-            'count': len(salaries),
-            'min_salary': np.min(salaries),
-            'max_salary': np.max(salaries),
-            'std_deviation': np.std(salaries)
-        }
-    
-    return skill_prices
-
-# %%
-# Load the cleaned data
-df = pd.read_csv("./cleaned_data_science_job_posts_and_salaries_2025.csv")
-
-# %%
-# Apply IQR filtering and normalization by country (similar to analysis.py)
-df_filtered = df.copy()
-df_filtered = df_filtered.groupby("country_code", group_keys=False).apply(iqr_filter).reset_index(drop=True)
-df_filtered = df_filtered.groupby("country_code", group_keys=False).apply(normalize_salary).reset_index(drop=True)
-df_unfiltered = df.copy()
-df_unfiltered = df_unfiltered.groupby("country_code", group_keys=False).apply(normalize_salary).reset_index(drop=True)
-
-# %%
-# Calculate skill prices with raw salaries
-skill_analysis = calculate_skill_prices(df, use_normalized=False)
-
-# %%
-# Calculate skill prices with normalized salaries (unfiltered)
-skill_analysis_normalized = calculate_skill_prices(df_unfiltered, use_normalized=True)
-
-# %%
-# Calculate skill prices with normalized salaries (filtered to remove outliers)
-skill_analysis_filtered_normalized = calculate_skill_prices(df_filtered, use_normalized=True)
-
-# %%
-# Convert the results to DataFrames for better visualization
-skill_df = pd.DataFrame(skill_analysis).T
-skill_df.index.name = 'skill'
-skill_df = skill_df.sort_values(by='average_salary', ascending=False)
-
-# Convert normalized results to DataFrame (unfiltered)
-skill_df_normalized = pd.DataFrame(skill_analysis_normalized).T
-skill_df_normalized.index.name = 'skill'
-skill_df_normalized = skill_df_normalized.sort_values(by='average_salary', ascending=False)
-
-# Convert filtered normalized results to DataFrame
-skill_df_filtered_normalized = pd.DataFrame(skill_analysis_filtered_normalized).T
-skill_df_filtered_normalized.index.name = 'skill'
-skill_df_filtered_normalized = skill_df_filtered_normalized.sort_values(by='average_salary', ascending=False)
+import cleaned_data
+import salary_normalization
+import skill_cooccurrence
+import skill_index
+from cleaned_data import cleaned_data_path, load_cleaned
+from salary_normalization import filter_and_normalize
+from skill_cooccurrence import calculate_skill_itemsets
+from skill_index import SKILL_INDEX_PATH, calculate_skill_prices, cleaned_skill_index
+from instrumentation import stage
+from stage_cache import cached
+
+# %%
+def skill_tables():
+    # Load the cleaned data
+    with stage("load_cleaned") as record:
+        df = load_cleaned()
+        record["rows_out"] = len(df)
+    # job x skill matrix rows follow rows of the cleaned dataset, so frames below keep original index
+    with stage("load_skill_index"):
+        skills = cleaned_skill_index()
+
+    # Apply IQR filtering and normalization by country (similar to analysis.py)
+    with stage("filter_and_normalize", len(df)) as record:
+        df_filtered, df_unfiltered = filter_and_normalize(df, "country_code")
+        record["rows_out"] = len(df_filtered)
+
+    # skill pairs and triples required by at least MIN_SUPPORT jobs (normalized salaries - filtered)
+    with stage("calculate_skill_itemsets", len(df_filtered)):
+        skill_pairs = calculate_skill_itemsets(df_filtered, use_normalized=True, index=skills, size=2)
+        skill_triples = calculate_skill_itemsets(df_filtered, use_normalized=True, index=skills, size=3)
+
+    with stage("calculate_skill_prices", len(df)):
+        return (
+            skill_pairs,
+            skill_triples,
+            # skill prices with raw salaries
+            calculate_skill_prices(df, use_normalized=False, index=skills),
+            # skill prices with normalized salaries (unfiltered)
+            calculate_skill_prices(df_unfiltered, use_normalized=True, index=skills),
+            # skill prices with normalized salaries (filtered to remove outliers)
+            calculate_skill_prices(df_filtered, use_normalized=True, index=skills),
+        )
+
+# %%
+# Calculate skill prices, cached until cleaned dataset or the code changes
+with stage("skill_tables"):
+    skill_pairs, skill_triples, skill_df, skill_df_normalized, skill_df_filtered_normalized = cached(
+        "skill_tables",
+        skill_tables,
+        inputs=[cleaned_data_path(), SKILL_INDEX_PATH],
+        code=[cleaned_data, salary_normalization, skill_index, skill_cooccurrence, skill_tables],
+        params={"by": "country_code"},
+    )
+
+# %%
+# Sort the results by average salary
+with stage("sort_skill_tables", len(skill_df)):
+    skill_df = skill_df.sort_values(by='average_salary', ascending=False)
+    skill_df_normalized = skill_df_normalized.sort_values(by='average_salary', ascending=False)
+    skill_df_filtered_normalized = skill_df_filtered_normalized.sort_values(by='average_salary', ascending=False)
 
 # %%
 # Display the top 10 highest paying skills (raw salaries)
@@ -142,14 +88,26 @@ print("\nTop 10 Skills by Job Count (Normalized Salaries - Filtered):")
 skill_df_filtered_normalized_by_count = skill_df_filtered_normalized.sort_values(by='count', ascending=False)
 print(skill_df_filtered_normalized_by_count.head(10))
 
+# %%
+print("\nTop 10 Skill Pairs by Premium over the First Skill (Normalized Salaries - Filtered):")
+print(skill_pairs.sort_values(by='premium_2', ascending=False).head(10))
+
+# %%
+print("\nTop 10 Skill Triples by Job Count (Normalized Salaries - Filtered):")
+print(skill_triples.head(10))
+
 # %%
 # Save all analyses to CSV files
-skill_df.to_csv("skill_price_analysis.csv")
-skill_df_normalized.to_csv("skill_price_analysis_normalized_unfiltered.csv")
-skill_df_filtered_normalized.to_csv("skill_price_analysis_normalized_filtered.csv")
+with stage("save_skill_tables", len(skill_df)):
+    skill_df.to_csv("skill_price_analysis.csv")
+    skill_df_normalized.to_csv("skill_price_analysis_normalized_unfiltered.csv")
+    skill_df_filtered_normalized.to_csv("skill_price_analysis_normalized_filtered.csv")
+    skill_pairs.to_csv("skill_pair_analysis_normalized_filtered.csv", index=False)
+    skill_triples.to_csv("skill_triple_analysis_normalized_filtered.csv", index=False)
 print("\nSkill analysis (raw) saved to 'skill_price_analysis.csv'")
 print("Skill analysis (normalized unfiltered) saved to 'skill_price_analysis_normalized_unfiltered.csv'")
 print("Skill analysis (normalized filtered) saved to 'skill_price_analysis_normalized_filtered.csv'")
+print("Skill pairs and triples (normalized filtered) saved to 'skill_pair_analysis_normalized_filtered.csv' and 'skill_triple_analysis_normalized_filtered.csv'")
 
 # %%
 # Additional insights for raw salaries
@@ -0,0 +1,168 @@
+# %%
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+from skill_index import cleaned_skill_index
+
+# %%
+# itemsets (pairs, triples, ...) of skills required together by at least MIN_SUPPORT jobs
+MIN_SUPPORT = 20
+# memory budget of the incidence matrix and the products of a block of itemsets
+MAX_BYTES = 256 * 2 ** 20
+
+
+# %%
+# itemsets are grown one skill at a time: jobs having an itemset are a column of a sparse
+# incidence matrix L (the product of the job columns of its skills), L.T @ X counts the jobs having
+# the itemset and each skill, L.T @ diag(salary) X sums their salaries. An itemset is only extended
+# with skills after its last one, and itemsets below min support are never extended,
+# a superset can't be required by more jobs than its subsets.
+def encode(items, width):
+    """
+    Integer key of every row of sorted skill ids, used to look itemsets up with searchsorted.
+    """
+    return (items * width ** np.arange(items.shape[1] - 1, -1, -1)).sum(axis=1)
+
+
+def block_bounds(nonzeros, skills, max_bytes):
+    """
+    Split itemsets into blocks whose incidence matrix and products with X fit in max_bytes.
+    """
+    # 12 bytes per nonzero of the incidence, 3 float64 products of at most skills columns per itemset
+    cost = np.cumsum(12 * nonzeros + 24 * skills)
+    bounds = [0]
+    while bounds[-1] < len(cost):
+        spent = cost[bounds[-1] - 1] if bounds[-1] else 0
+        bounds.append(max(bounds[-1] + 1, int(np.searchsorted(cost, spent + max_bytes, side="right"))))
+    return bounds
+
+
+def extend(items, X, Xy, Xyy, min_support, max_bytes):
+    """
+    Counts and salary sums of the itemsets extended with one more skill, above min support.
+
+    Yields (itemsets, count, sum, sum of squares) arrays of every block of itemsets.
+    """
+    nonzeros = np.diff(X.indptr)[items[:, 0]]
+    # X is column major for selecting skills, products are faster against row major copies
+    by_job, Xy, Xyy = X.tocsr(), Xy.tocsr(), Xyy.tocsr()
+    bounds = block_bounds(nonzeros, X.shape[1], max_bytes)
+    for start, stop in zip(bounds[:-1], bounds[1:]):
+        incidence = X[:, items[start:stop, 0]]
+        for column in items[start:stop, 1:].T:
+            incidence = incidence.multiply(X[:, column])
+        block = sp.csr_matrix(incidence.T)
+        counts = (block @ by_job).tocoo()
+        keep = (counts.col > items[start + counts.row, -1]) & (counts.data >= min_support)
+        # e.g. the block of the last skills can't be extended, fancy indexing with empty arrays isn't empty
+        if not keep.any():
+            continue
+        rows, cols = counts.row[keep], counts.col[keep]
+        yield (
+            np.column_stack([items[start + rows], cols]).astype(np.int64),
+            counts.data[keep],
+            np.asarray((block @ Xy)[rows, cols]).ravel(),
+            np.asarray((block @ Xyy)[rows, cols]).ravel(),
+        )
+
+
+def empty_block(size):
+    return [(np.empty((0, size), dtype=np.int64), np.empty(0), np.empty(0), np.empty(0))]
+
+
+def describe(items, count, total, squares, names, singles, jobs, previous):
+    """
+    Output rows of itemset_stats, previous holds average salaries of the smaller itemsets by their key.
+    """
+    size = items.shape[1]
+    mean = total / count
+    stats = pd.DataFrame({f"skill_{i + 1}": names[items[:, i]] for i in range(size)})
+    stats["count"] = count.astype(np.int64)
+    stats["lift"] = count * float(jobs) ** (size - 1) / np.prod(singles[items], axis=1)
+    stats["average_salary"] = mean
+    stats["std_deviation"] = np.sqrt(np.maximum(squares / count - mean ** 2, 0))
+    if size > 1:
+        for i in range(size):
+            subsets = encode(np.delete(items, i, axis=1), len(names))
+            stats[f"premium_{i + 1}"] = mean - previous.to_numpy()[previous.index.searchsorted(subsets)]
+    return stats
+
+
+def itemset_stats(
+    matrix,
+    vocabulary,
+    salary,
+    rows=None,
+    size=2,
+    min_support=MIN_SUPPORT,
+    top_k=None,
+    sort_by="count",
+    max_bytes=MAX_BYTES,
+):
+    """
+    Salary statistics of the jobs requiring every skill of an itemset, for itemsets of size skills.
+
+    Args:
+        matrix: job x skill CSR matrix
+        vocabulary: skill names indexed by column
+        salary: salaries of the selected jobs
+        rows: positions of the selected jobs in matrix, aligned with salary, all rows by default
+        size: number of skills in an itemset, 2 for pairs, 3 for triples
+        min_support: itemsets required by fewer jobs are left out
+        top_k: keep only top_k itemsets by sort_by, pruned block by block
+        sort_by: column to order the result by, descending
+        max_bytes: memory budget of a block of itemsets, their incidence matrix and sparse products
+
+    Returns DataFrame with skill_1 ... skill_<size>, count, lift (count against independent skills),
+    average_salary, std_deviation (population std) and premium_<i> columns: average salary
+    of the itemset minus the one of the itemset without skill_<i>, e.g. premium_2 of spark, scala
+    is what jobs asking for scala besides spark pay over all jobs asking for spark.
+    """
+    salary = np.asarray(salary, dtype=float)
+    selected = (matrix if rows is None else matrix[np.asarray(rows)]).tocsc()
+    jobs = selected.shape[0]
+    frequent = np.flatnonzero(np.diff(selected.indptr) >= min_support)
+    X = sp.csc_matrix(selected[:, frequent], dtype=np.float64)
+    X.data[:] = 1
+    Xy = sp.diags(salary) @ X
+    Xyy = sp.diags(salary ** 2) @ X
+    names = np.asarray(vocabulary)[frequent]
+    singles = np.asarray(X.sum(axis=0)).ravel()
+
+    # level 1, every frequent skill on its own
+    items = np.arange(len(names)).reshape(-1, 1)
+    count, total, squares = singles, np.asarray(Xy.sum(axis=0)).ravel(), np.asarray(Xyy.sum(axis=0)).ravel()
+    blocks = [(items, count, total, squares)]
+    previous = pd.Series(dtype=float)
+    for level in range(2, size + 1):
+        previous = pd.Series(total / count, index=encode(items, len(names))).sort_index()
+        blocks = extend(items, X, Xy, Xyy, min_support, max_bytes)
+        if level < size:
+            items, count, total, squares = [np.concatenate(parts) for parts in zip(*blocks, *empty_block(level))]
+    stats = None
+    for block in blocks:
+        if not len(block[0]):
+            continue
+        block_stats = describe(*block, names, singles, jobs, previous)
+        stats = block_stats if stats is None else pd.concat([stats, block_stats], ignore_index=True)
+        if top_k is not None:
+            stats = stats.sort_values(sort_by, ascending=False, kind="stable").head(top_k)
+    if stats is None:
+        stats = describe(*empty_block(size)[0], names, singles, jobs, previous)
+    return stats.sort_values(sort_by, ascending=False, kind="stable").reset_index(drop=True)
+
+
+def calculate_skill_itemsets(df, use_normalized=True, index=None, **kwargs):
+    """
+    itemset_stats of the jobs in df with the precomputed skill index.
+
+    Args:
+        df: DataFrame with job data, index labels are row numbers in the cleaned dataset
+        use_normalized: Whether to use normalized salary instead of raw salary
+        index: (matrix, vocabulary) pair, cleaned_skill_index() by default
+        kwargs: passed to itemset_stats, e.g. size, min_support, top_k
+    """
+    matrix, vocabulary = cleaned_skill_index() if index is None else index
+    salary_col = "salary_avg_normalized" if use_normalized else "salary_avg"
+    return itemset_stats(matrix, vocabulary, df[salary_col], rows=df.index, **kwargs)
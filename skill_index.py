@@ -0,0 +1,225 @@
+# %%
+import ast
+import os
+import re
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+# %%
+SKILL_INDEX_PATH = "./cleaned_data_science_job_posts_and_salaries_2025_skills.npz"
+# quoted items of skill list literals like "['python', \"rock'n'roll\"]", newlines separate the lists
+SKILL_TOKEN = re.compile(r"""'(?:[^'\\\n]|\\.)*'|"(?:[^"\\\n]|\\.)*"|\n""")
+
+
+# %%
+def parse_skill_lists(skills, vocabulary=None, mapping=None):
+    """
+    Parse string representations of skill lists into interned skill ids.
+
+    Args:
+        skills: Series of list literals as in the raw data and the cleaned csv, missing values mean no skills
+        vocabulary: dict skill -> id, extended in place with unseen skills
+        mapping: dict of skill aliases, applied once per distinct skill
+
+    Returns offsets, ids and the vocabulary: skills of row i are ids[offsets[i]:offsets[i + 1]],
+    in order of their first occurrence, every skill at most once per row.
+    The lists are tokenized with one regex scan over all rows instead of a Python parse per row.
+    """
+    if vocabulary is None:
+        vocabulary = {}
+    mapping = mapping or {}
+    text = "\n".join(pd.Series(skills).fillna("").astype(str).str.replace("\n", " ", regex=False))
+    tokens = np.array(SKILL_TOKEN.findall(text) + ["\n"], dtype=object)
+    separator = tokens == "\n"
+    rows = np.cumsum(separator)[~separator]
+    codes, uniques = pd.factorize(tokens[~separator])
+    # quotes are only unescaped for the rare items with backslashes
+    names = [token[1:-1] if "\\" not in token else ast.literal_eval(token) for token in uniques]
+    ids = np.array(
+        [vocabulary.setdefault(mapping.get(name, name), len(vocabulary)) for name in names], dtype=np.int64
+    )[codes]
+    # aliases can repeat a skill within a row, keep its first occurrence
+    _, first = np.unique(rows * max(len(vocabulary), 1) + ids, return_index=True)
+    keep = np.sort(first)
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(rows[keep], minlength=len(skills)))])
+    return offsets, ids[keep].astype(np.int32), vocabulary
+
+
+def skill_lists(offsets, ids, vocabulary):
+    """
+    Lists of skill names of every row from parse_skill_lists output, names are shared between rows.
+    """
+    names = np.array(list(vocabulary), dtype=object)[ids].tolist()
+    return [names[start:stop] for start, stop in zip(offsets[:-1], offsets[1:])]
+
+
+# %%
+def build_skill_index(skills, vocabulary=None):
+    """
+    Build job x skill incidence matrix from a column of skill lists.
+
+    Args:
+        skills: Series of skill lists, missing values mean no skills
+        vocabulary: dict skill -> column id, extended in place with unseen skills,
+            pass the same dict to index a dataset chunk by chunk
+
+    Returns CSR matrix with a row per job and a column per vocabulary entry and the vocabulary.
+    Skills are lowercased and stripped, a job has each skill at most once.
+    """
+    if vocabulary is None:
+        vocabulary = {}
+    exploded = pd.Series(skills).reset_index(drop=True).explode().dropna()
+    codes, uniques = pd.factorize(exploded.astype(str).str.lower().str.strip())
+    # ids are assigned in order of first appearance, like keys of a dict filled row by row
+    ids = np.array([vocabulary.setdefault(skill, len(vocabulary)) for skill in uniques], dtype=np.int32)
+    matrix = sp.csr_matrix(
+        (np.ones(len(codes), dtype=np.int8), (exploded.index.to_numpy(), ids[codes])),
+        shape=(len(skills), len(vocabulary)),
+    )
+    matrix.data[:] = 1  # duplicates were summed up
+    return matrix, vocabulary
+
+
+def skill_index_from_ids(offsets, ids, names, vocabulary=None):
+    """
+    Build job x skill incidence matrix straight from parse_skill_lists output.
+
+    Args:
+        offsets, ids: skills of row i are ids[offsets[i]:offsets[i + 1]]
+        names: skill of every id
+        vocabulary: dict skill -> column id, extended in place with unseen skills
+
+    Returns CSR matrix and the vocabulary like build_skill_index, offsets are the row pointers
+    and ids are mapped to columns once per distinct skill instead of once per occurrence.
+    """
+    if vocabulary is None:
+        vocabulary = {}
+    columns = np.array([vocabulary.setdefault(name.lower().strip(), len(vocabulary)) for name in names], dtype=np.int32)
+    matrix = sp.csr_matrix(
+        (np.ones(len(ids), dtype=np.int8), columns[ids], offsets), shape=(len(offsets) - 1, len(vocabulary))
+    )
+    # skills differing only in case or spaces share a column
+    if len(np.unique(columns)) < len(columns):
+        matrix.sum_duplicates()
+        matrix.data[:] = 1
+    matrix.sort_indices()
+    return matrix, vocabulary
+
+
+def stack_skill_index(matrices, vocabulary):
+    """
+    Stack per chunk matrices built against a shared vocabulary into one matrix.
+    """
+    width = len(vocabulary)
+    return sp.vstack(
+        [sp.csr_matrix((m.data, m.indices, m.indptr), shape=(m.shape[0], width)) for m in matrices],
+        format="csr",
+    )
+
+
+def save_skill_index(matrix, vocabulary, path=SKILL_INDEX_PATH):
+    np.savez(
+        path,
+        indptr=matrix.indptr,
+        indices=matrix.indices,
+        shape=np.array(matrix.shape),
+        vocabulary=np.array(list(vocabulary), dtype=str),
+    )
+
+
+def load_skill_index(path=SKILL_INDEX_PATH):
+    """
+    Load job x skill matrix saved by data_cleaning.py, rows match rows of the cleaned dataset.
+
+    Returns CSR matrix and array of skill names indexed by column.
+    """
+    with np.load(path) as index:
+        matrix = sp.csr_matrix(
+            (np.ones(len(index["indices"]), dtype=np.int8), index["indices"], index["indptr"]),
+            shape=tuple(index["shape"]),
+        )
+        return matrix, index["vocabulary"]
+
+
+def cleaned_skill_index(path=SKILL_INDEX_PATH, data_path=None):
+    """
+    Job x skill matrix whose rows follow the rows of the cleaned dataset load_cleaned reads.
+
+    The saved index is loaded unless it is missing, older than the cleaned dataset or has
+    a different number of rows, e.g. it isn't committed or data_cleaning.py ran with
+    --skill-index-output '', then it is built from the skills column of the cleaned dataset.
+
+    Returns CSR matrix and array of skill names indexed by column like load_skill_index.
+    """
+    # cleaned_data parses skill lists with this module, so it is imported on use
+    import cleaned_data
+
+    data_path = data_path or cleaned_data.cleaned_data_path()
+    rows = cleaned_data.row_count(data_path)
+    if os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(data_path):
+        matrix, vocabulary = load_skill_index(path)
+        if matrix.shape[0] == rows:
+            return matrix, vocabulary
+    if data_path.endswith(".parquet"):
+        skills = cleaned_data.load_cleaned(parquet_path=data_path, columns=["skills"])["skills"]
+    else:
+        skills = cleaned_data.load_cleaned(parquet_path="", csv_path=data_path, columns=["skills"])["skills"]
+    matrix, vocabulary = build_skill_index(skills)
+    return matrix, np.array(list(vocabulary), dtype=str)
+
+
+# %%
+def skill_prices(matrix, vocabulary, salary, rows=None):
+    """
+    Salary statistics of the jobs requiring each skill.
+
+    Args:
+        matrix: job x skill CSR matrix
+        vocabulary: skill names indexed by column
+        salary: salaries of the selected jobs
+        rows: positions of the selected jobs in matrix, aligned with salary, all rows by default
+
+    Returns DataFrame indexed by skill with average_salary, count, min_salary, max_salary
+    and std_deviation (population std) columns. Skills are ordered by their first job in rows,
+    skills of no selected job are left out.
+    """
+    salary = np.asarray(salary, dtype=float)
+    selected = matrix if rows is None else matrix[np.asarray(rows)]
+    # in CSC layout salaries of every skill are a contiguous slice, aggregated with reduceat
+    by_skill = selected.tocsc()
+    by_skill.sort_indices()
+    counts = np.diff(by_skill.indptr)
+    present = np.flatnonzero(counts)
+    starts = by_skill.indptr[present]
+    values = salary[by_skill.indices]
+    count = counts[present]
+    mean = np.add.reduceat(values, starts) / count
+    deviation = values - np.repeat(mean, count)
+    stats = pd.DataFrame(
+        {
+            "average_salary": mean,
+            "count": count,
+            "min_salary": np.minimum.reduceat(values, starts),
+            "max_salary": np.maximum.reduceat(values, starts),
+            "std_deviation": np.sqrt(np.add.reduceat(deviation ** 2, starts) / count),
+        },
+        index=pd.Index(np.asarray(vocabulary)[present], name="skill"),
+    )
+    first_job = by_skill.indices[starts]
+    return stats.iloc[np.argsort(first_job, kind="stable")]
+
+
+def calculate_skill_prices(df, use_normalized=False, index=None):
+    """
+    Calculate salary statistics for each skill with the precomputed skill index.
+
+    Args:
+        df: DataFrame with job data, index labels are row numbers in the cleaned dataset
+        use_normalized: Whether to use normalized salary instead of raw salary
+        index: (matrix, vocabulary) pair, cleaned_skill_index() by default
+    """
+    matrix, vocabulary = cleaned_skill_index() if index is None else index
+    salary_col = "salary_avg_normalized" if use_normalized else "salary_avg"
+    return skill_prices(matrix, vocabulary, df[salary_col], rows=df.index)
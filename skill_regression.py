@@ -0,0 +1,197 @@
+# %%
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from scipy.sparse.linalg import lsqr
+
+from cleaned_data import load_cleaned
+from salary_normalization import filter_and_normalize
+from skill_index import cleaned_skill_index
+
+# %%
+# L2 penalty of the coefficients, keeps rare skills and fixed effects from taking extreme values,
+# intercept and seniority aren't penalized so they aren't shrunk towards 0 on raw salaries
+RIDGE = 1.0
+UNPENALIZED_KINDS = ["intercept", "seniority"]
+BOOTSTRAP_SAMPLES = 200
+CONFIDENCE = 0.95
+FIXED_EFFECTS = ["country_code", "industry"]
+OUTPUT_PATH = "./skill_regression_normalized_filtered.csv"
+
+
+# %%
+# salary is regressed on skill indicators, seniority and fixed effects of country and industry,
+# so a skill's coefficient is the salary of jobs requiring it over jobs of the same seniority,
+# country and industry without it, instead of the average of jobs requiring it
+def design_matrix(df, matrix, vocabulary, fixed_effects=FIXED_EFFECTS):
+    """
+    Sparse design matrix of the jobs in df, a row per job.
+
+    Args:
+        df: DataFrame with job data, index labels are row numbers in the cleaned dataset
+        matrix: job x skill CSR matrix
+        vocabulary: skill names indexed by column
+        fixed_effects: categorical columns getting an indicator per value
+
+    Returns CSR matrix and DataFrame describing its columns with term, kind and jobs (rows with a nonzero value).
+    Missing seniority is filled with the mean level and flagged by its own indicator,
+    jobs with a missing fixed effect value get no indicator of it.
+    """
+    rows = len(df)
+    seniority = df["seniority_level_num"].astype("float64")
+    missing = seniority.isna().to_numpy()
+    blocks = [
+        sp.csr_matrix(np.ones((rows, 1))),
+        sp.csr_matrix(seniority.fillna(seniority.mean()).to_numpy().reshape(-1, 1)),
+        sp.csr_matrix(missing.astype(float).reshape(-1, 1)),
+    ]
+    terms = [("intercept", "intercept"), ("seniority_level_num", "seniority"), ("seniority_missing", "seniority")]
+    for column in fixed_effects:
+        codes, values = pd.factorize(df[column], sort=True)
+        present = codes >= 0
+        blocks.append(sp.csr_matrix(
+            (np.ones(present.sum()), (np.flatnonzero(present), codes[present])), shape=(rows, len(values))
+        ))
+        terms.extend((value, column) for value in values)
+    skills = sp.csr_matrix(matrix[np.asarray(df.index)], dtype=np.float64)
+    used = np.flatnonzero(skills.getnnz(axis=0))
+    blocks.append(skills[:, used])
+    terms.extend((skill, "skill") for skill in np.asarray(vocabulary)[used])
+    design = sp.hstack(blocks, format="csr")
+    columns = pd.DataFrame(terms, columns=["term", "kind"])
+    columns["jobs"] = design.getnnz(axis=0)
+    return design, columns
+
+
+def fit(design, salary, ridge=RIDGE, weights=None, x0=None, penalized=None):
+    """
+    Ridge least squares coefficients with LSQR, which only needs products with the sparse matrix.
+
+    Args:
+        weights: times every row is counted, e.g. bootstrap counts
+        x0: starting coefficients, e.g. the fit on all rows, saves iterations
+        penalized: boolean mask of the columns the penalty applies to, all by default
+    """
+    if weights is not None:
+        scale = np.sqrt(weights)
+        design, salary = sp.diags(scale) @ design, salary * scale
+    # the penalty is stacked as rows sqrt(ridge) * D = 0 with D diagonal, 0 for unpenalized columns,
+    # LSQR's damp would penalize the step from x0 and every column instead
+    width = design.shape[1]
+    penalty = np.sqrt(ridge) * (np.ones(width) if penalized is None else np.asarray(penalized, dtype=float))
+    design = sp.vstack([design, sp.diags(penalty, format="csr")], format="csr")
+    salary = np.concatenate([salary, np.zeros(width)])
+    return lsqr(design, salary, atol=1e-10, btol=1e-10, x0=x0)[0]
+
+
+# %%
+# design, salary, ridge, coefficients of all rows and penalized columns, handed to every worker once at its start
+worker_problem = None
+
+
+def init_worker(problem):
+    global worker_problem
+    worker_problem = problem
+
+
+def bootstrap_fit(seed):
+    """
+    Coefficients on rows resampled with replacement, the resample is given as row counts.
+    """
+    design, salary, ridge, coefficients, penalized = worker_problem
+    rng = np.random.default_rng(seed)
+    rows = len(salary)
+    weights = np.bincount(rng.integers(0, rows, rows), minlength=rows)
+    return fit(design, salary, ridge, weights, x0=coefficients, penalized=penalized)
+
+
+def bootstrap(
+    design, salary, coefficients, ridge=RIDGE, samples=BOOTSTRAP_SAMPLES, seed=0, jobs=None, penalized=None
+):
+    """
+    Coefficients of samples bootstrap resamples, fitted on a pool of jobs processes.
+
+    Every resample has its own seed spawned from seed, so results don't depend on jobs.
+    jobs=1 fits them one by one in this process.
+    """
+    seeds = np.random.SeedSequence(seed).spawn(samples)
+    problem = (design, salary, ridge, coefficients, penalized)
+    if jobs == 1:
+        init_worker(problem)
+        return np.array([bootstrap_fit(s) for s in seeds])
+    jobs = jobs or os.cpu_count()
+    with ProcessPoolExecutor(max_workers=jobs, initializer=init_worker, initargs=(problem,)) as pool:
+        return np.array(list(pool.map(bootstrap_fit, seeds, chunksize=max(1, samples // (4 * jobs)))))
+
+
+def skill_regression(
+    df,
+    use_normalized=True,
+    index=None,
+    ridge=RIDGE,
+    samples=BOOTSTRAP_SAMPLES,
+    confidence=CONFIDENCE,
+    seed=0,
+    jobs=None,
+):
+    """
+    Regression skill prices with bootstrap confidence intervals.
+
+    Args:
+        df: DataFrame with job data, index labels are row numbers in the cleaned dataset
+        use_normalized: Whether to use normalized salary instead of raw salary
+        index: (matrix, vocabulary) pair, cleaned_skill_index() by default
+        ridge: L2 penalty of the coefficients
+        samples: number of bootstrap resamples, 0 skips the confidence intervals
+        confidence: coverage of the percentile confidence intervals
+        seed: seed of the resamples
+        jobs: worker processes of the bootstrap, all cores by default
+
+    Returns DataFrame with a row per term (intercept, seniority, fixed effect values, skills)
+    with term, kind, jobs, coefficient, ci_low and ci_high columns.
+    """
+    matrix, vocabulary = cleaned_skill_index() if index is None else index
+    salary_col = "salary_avg_normalized" if use_normalized else "salary_avg"
+    salary = df[salary_col].to_numpy(dtype=float)
+    design, terms = design_matrix(df, matrix, vocabulary)
+    penalized = ~terms["kind"].isin(UNPENALIZED_KINDS).to_numpy()
+    terms["coefficient"] = fit(design, salary, ridge, penalized=penalized)
+    if samples:
+        fits = bootstrap(design, salary, terms["coefficient"].to_numpy(), ridge, samples, seed, jobs, penalized)
+        tail = (1 - confidence) / 2
+        terms["ci_low"], terms["ci_high"] = np.quantile(fits, [tail, 1 - tail], axis=0)
+    return terms
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Skill prices from a ridge regression of normalized salary with bootstrap confidence intervals"
+    )
+    parser.add_argument("--ridge", type=float, default=RIDGE, help="L2 penalty of the coefficients")
+    parser.add_argument("--samples", type=int, default=BOOTSTRAP_SAMPLES, help="bootstrap resamples, 0 to skip")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the bootstrap resamples")
+    parser.add_argument(
+        "--jobs", type=int, default=os.cpu_count(),
+        help="number of worker processes of the bootstrap, 1 fits in the main process",
+    )
+    parser.add_argument("--output", default=OUTPUT_PATH)
+    return parser.parse_args(argv)
+
+# %%
+if __name__ == "__main__":
+    args = parse_args()
+    df_filtered, _ = filter_and_normalize(load_cleaned(), "country_code")
+    start = time.perf_counter()
+    terms = skill_regression(
+        df_filtered, ridge=args.ridge, samples=args.samples, seed=args.seed, jobs=args.jobs,
+    )
+    skills = terms[terms["kind"] == "skill"].sort_values("coefficient", ascending=False)
+    print(skills.head(10).to_string(index=False))
+    print(f"{(time.perf_counter() - start):.2f} s")
+    terms.to_csv(args.output, index=False)
+    print(f"Skill regression saved to '{args.output}'")
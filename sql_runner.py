@@ -0,0 +1,141 @@
+# %%
+import argparse
+import re
+import sqlite3
+import time
+
+import pandas as pd
+import pyarrow.parquet as pq
+
+from cleaned_data import CLEANED_CSV_PATH, CLEANED_PARQUET_PATH, cleaned_data_path, load_cleaned
+
+try:
+    import duckdb
+except ImportError:  # sqlite from the standard library is used instead
+    duckdb = None
+
+# %%
+QUERIES_PATH = "./questions.sql"
+TABLE_NAME = "jobs"
+
+
+def split_queries(sql):
+    """
+    Split SQL script into statements.
+
+    Returns list of (title, query) pairs, title is the last "-- N. ..." comment before the query.
+    """
+    queries = []
+    title = None
+    statement = []
+    for line in sql.splitlines():
+        stripped = line.strip()
+        if stripped.startswith("--"):
+            match = re.match(r"--\s*(\d+\..*)", stripped)
+            if match:
+                title = match.group(1).strip()
+            continue
+        statement.append(line)
+        if stripped.endswith(";"):
+            query = "\n".join(statement).strip()
+            if query != ";":
+                queries.append((title, query))
+            statement = []
+    return queries
+
+
+# %%
+def connect_duckdb(path):
+    """
+    In-memory DuckDB with the cleaned dataset registered as jobs table,
+    a Parquet file is scanned through Arrow without copying.
+    """
+    con = duckdb.connect()
+    if path.endswith(".parquet"):
+        con.register(TABLE_NAME, pq.read_table(path, memory_map=True))
+    else:
+        con.execute(f"CREATE TABLE {TABLE_NAME} AS SELECT * FROM read_csv_auto(?)", [path])
+    return con
+
+
+def connect_sqlite(path):
+    """
+    In-memory SQLite with the cleaned dataset loaded into jobs table.
+    """
+    if path.endswith(".parquet"):
+        df = load_cleaned(parquet_path=path)
+    else:
+        df = load_cleaned(parquet_path="", csv_path=path)
+    # sqlite has no categorical, date or list types
+    for col in df.select_dtypes("category"):
+        df[col] = df[col].astype(object)
+    df["post_date"] = df["post_date"].dt.strftime("%Y-%m-%d")
+    df["skills"] = df["skills"].map(lambda skills: repr(list(skills)), na_action="ignore")
+    con = sqlite3.connect(":memory:")
+    df.to_sql(TABLE_NAME, con, index=False)
+    return con
+
+
+def connect(engine, path):
+    if engine == "duckdb":
+        return connect_duckdb(path)
+    return connect_sqlite(path)
+
+
+def run_query(con, query):
+    """
+    Returns query result as DataFrame and wall time in seconds.
+    """
+    start = time.perf_counter()
+    cursor = con.execute(query)
+    rows = cursor.fetchall()
+    elapsed = time.perf_counter() - start
+    return pd.DataFrame(rows, columns=[column[0] for column in cursor.description]), elapsed
+
+
+def run_queries(con, queries):
+    """
+    Run every (title, query) pair, a failing query is reported and doesn't stop the rest.
+
+    Returns list of dicts with title, seconds, result and error.
+    """
+    report = []
+    for title, query in queries:
+        try:
+            result, seconds = run_query(con, query)
+            report.append({"title": title, "seconds": seconds, "result": result, "error": None})
+        except Exception as error:
+            report.append({"title": title, "seconds": None, "result": None, "error": str(error)})
+    return report
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run questions.sql against the cleaned dataset")
+    parser.add_argument("--queries", default=QUERIES_PATH, help="SQL script")
+    parser.add_argument(
+        "--data", default=None,
+        help=f"cleaned dataset, {CLEANED_PARQUET_PATH} or {CLEANED_CSV_PATH}, "
+             "the Parquet file is used if it exists",
+    )
+    parser.add_argument(
+        "--engine", choices=["duckdb", "sqlite"], default="duckdb" if duckdb is not None else "sqlite",
+        help="embedded database engine, duckdb if installed",
+    )
+    parser.add_argument("--rows", type=int, default=10, help="number of result rows to show")
+    return parser.parse_args(argv)
+
+# %%
+if __name__ == "__main__":
+    args = parse_args()
+    with open(args.queries) as f:
+        queries = split_queries(f.read())
+    start = time.perf_counter()
+    con = connect(args.engine, args.data or cleaned_data_path())
+    print(f"Loaded {TABLE_NAME} into {args.engine} in {time.perf_counter() - start:.3f} s")
+    for query in run_queries(con, queries):
+        print(f"\n-- {query['title']}")
+        if query["error"] is not None:
+            print(f"failed: {query['error']}")
+            continue
+        print(f"{query['seconds'] * 1000:.2f} ms, {len(query['result'])} rows")
+        print(query["result"].head(args.rows).to_string(index=False))
@@ -0,0 +1,114 @@
+# %%
+import hashlib
+import inspect
+import os
+import pickle
+import shutil
+
+# %%
+# set STAGE_CACHE=off to always recompute
+CACHE_ENABLED = os.environ.get("STAGE_CACHE", "on") != "off"
+CACHE_DIR = os.environ.get("STAGE_CACHE_DIR", "./.stage_cache")
+# least recently used entries are evicted once the cache grows over this size
+CACHE_MAX_BYTES = int(os.environ.get("STAGE_CACHE_MAX_BYTES", 2 * 1024 ** 3))
+
+
+# %%
+def file_digest(path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def stage_key(name, inputs=(), code=(), params=None):
+    """
+    Hash of stage name, contents of input files (missing ones included), source code of modules or functions
+    the stage depends on and its parameters.
+    """
+    digest = hashlib.sha256(name.encode())
+    for path in inputs:
+        # optional inputs, e.g. a skill index built on demand, are keyed as missing
+        digest.update((file_digest(path) if os.path.exists(path) else "missing").encode())
+    for obj in code:
+        digest.update(inspect.getsource(obj).encode())
+    digest.update(repr(sorted((params or {}).items())).encode())
+    return digest.hexdigest()
+
+
+def entry_size(path):
+    if os.path.isdir(path):
+        return sum(entry_size(os.path.join(path, name)) for name in os.listdir(path))
+    return os.path.getsize(path)
+
+
+def evict(cache_dir=CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+    """
+    Remove least recently used entries until cache fits into max_bytes.
+    """
+    entries = [os.path.join(cache_dir, name) for name in os.listdir(cache_dir)]
+    entries = sorted(entries, key=os.path.getmtime, reverse=True)
+    total = 0
+    for path in entries:
+        total += entry_size(path)
+        if total > max_bytes:
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+
+
+# %%
+def cached(name, compute, inputs=(), code=(), params=None, cache_dir=CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+    """
+    Return result of compute() for the stage, stored as pickle and reused
+    while stage_key(name, inputs, code, params) stays the same.
+
+    Args:
+        name: stage name
+        compute: function without arguments computing the result
+        inputs: paths of files the stage reads
+        code: modules or functions the stage runs
+        params: dict of stage parameters
+    """
+    if not CACHE_ENABLED:
+        return compute()
+    path = os.path.join(cache_dir, f"{name}-{stage_key(name, inputs, code, params)}.pkl")
+    if os.path.exists(path):
+        os.utime(path)  # mark as recently used
+        with open(path, "rb") as f:
+            return pickle.load(f)
+    result = compute()
+    os.makedirs(cache_dir, exist_ok=True)
+    with open(path + ".tmp", "wb") as f:
+        pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(path + ".tmp", path)
+    evict(cache_dir, max_bytes)
+    return result
+
+
+def cached_files(name, outputs, compute, inputs=(), code=(), params=None, cache_dir=CACHE_DIR,
+                 max_bytes=CACHE_MAX_BYTES):
+    """
+    Run compute() writing output files, or restore the files from cache
+    while stage_key(name, inputs, code, params) stays the same.
+
+    Returns True if outputs were restored from cache.
+    """
+    if not CACHE_ENABLED:
+        compute()
+        return False
+    path = os.path.join(cache_dir, f"{name}-{stage_key(name, inputs, code, params)}")
+    if os.path.isdir(path):
+        os.utime(path)
+        for i, output in enumerate(outputs):
+            shutil.copyfile(os.path.join(path, str(i)), output)
+        return True
+    compute()
+    os.makedirs(path + ".tmp", exist_ok=True)
+    for i, output in enumerate(outputs):
+        shutil.copyfile(output, os.path.join(path + ".tmp", str(i)))
+    os.replace(path + ".tmp", path)
+    evict(cache_dir, max_bytes)
+    return False
@@ -0,0 +1,60 @@
+import itertools
+
+import numpy as np
+import pytest
+import scipy.sparse as sp
+
+from skill_cooccurrence import itemset_stats
+
+
+def random_postings(jobs=400, skills=12, seed=0):
+    rng = np.random.default_rng(seed)
+    matrix = sp.csr_matrix((rng.random((jobs, skills)) < 0.3).astype(np.int8))
+    vocabulary = np.array([f"skill_{i:02d}" for i in range(skills)])
+    return matrix, vocabulary, rng.normal(size=jobs)
+
+
+def brute_force(matrix, vocabulary, salary, size):
+    """
+    Salaries of the jobs requiring every itemset of up to size skills, enumerated job by job.
+    """
+    salaries = {}
+    for job in range(matrix.shape[0]):
+        skills = sorted(vocabulary[matrix.indices[matrix.indptr[job]:matrix.indptr[job + 1]]])
+        for length in range(1, size + 1):
+            for itemset in itertools.combinations(skills, length):
+                salaries.setdefault(itemset, []).append(salary[job])
+    return salaries
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 4])
+@pytest.mark.parametrize("max_bytes", [2000, 20000, 256 * 2 ** 20])
+def test_itemset_stats_match_brute_force(size, max_bytes):
+    matrix, vocabulary, salary = random_postings()
+    min_support = 5
+    stats = itemset_stats(matrix, vocabulary, salary, size=size, min_support=min_support, max_bytes=max_bytes)
+    salaries = brute_force(matrix, vocabulary, salary, size)
+    expected = {
+        itemset: values for itemset, values in salaries.items()
+        if len(itemset) == size and len(values) >= min_support
+    }
+    assert len(stats) == len(expected)
+    for row in stats.itertuples(index=False):
+        row = row._asdict()
+        names = [row[f"skill_{i + 1}"] for i in range(size)]
+        values = np.array(expected[tuple(sorted(names))])
+        assert row["count"] == len(values)
+        assert row["average_salary"] == pytest.approx(values.mean())
+        assert row["std_deviation"] == pytest.approx(values.std(), abs=1e-9)
+        for i in range(size if size > 1 else 0):
+            subset = tuple(sorted(names[:i] + names[i + 1:]))
+            assert row[f"premium_{i + 1}"] == pytest.approx(values.mean() - np.mean(salaries[subset]))
+
+
+def test_top_k_pruned_by_blocks_matches_full_result():
+    matrix, vocabulary, salary = random_postings(seed=1)
+    full = itemset_stats(matrix, vocabulary, salary, size=3, min_support=5, sort_by="average_salary")
+    pruned = itemset_stats(
+        matrix, vocabulary, salary, size=3, min_support=5, sort_by="average_salary", top_k=10, max_bytes=2000
+    )
+    assert pruned.equals(full.head(10))